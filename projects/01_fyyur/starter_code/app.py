@@ -3,18 +3,35 @@
 #----------------------------------------------------------------------------#
 
 import json
+import base64
 import dateutil.parser
-import babel
-from flask import Flask, render_template, request, Response, flash, redirect, url_for
+import functools
+import babel.dates
+from flask import Flask, render_template, request, Response, flash, redirect, url_for, abort, jsonify, stream_with_context
 from flask_moment import Moment
 from flask_sqlalchemy import SQLAlchemy
 
-import logging
-from logging import Formatter, FileHandler
 from flask_wtf import Form, CsrfProtect
+from flask_wtf.csrf import generate_csrf
 from forms import *
+from cache import PrefixCache, ResponseCache
+from prerender import PrerenderedPages
+import importer
+import exporter
+import reads
+import partitions
+import related
+import geo
+import benchmark
+from logs import init_logging
+from profiler import SQLProfiler
 from flask_migrate import Migrate
 import datetime
+import time
+import click
+from sqlalchemy import event, exc
+from sqlalchemy.dialects.postgresql import TSRANGE
+from psycopg2.extras import DateTimeRange
 #----------------------------------------------------------------------------#
 # App Config.
 #----------------------------------------------------------------------------#
@@ -33,6 +50,20 @@ db = SQLAlchemy(app)
 
 migrate = Migrate(app, db)
 
+response_cache = ResponseCache(app)
+prefix_cache = PrefixCache(app)
+response_cache.link(prefix_cache)
+prerendered = PrerenderedPages()
+
+SEARCH_RESULTS_PER_PAGE = 10
+LISTING_PER_PAGE = 30
+AUTOCOMPLETE_MAX_RESULTS = 20
+CHANGES_PER_PAGE = 500
+RELATED_PER_KIND = 5
+RELATED_MAX_BUCKET = 100
+RELATED_MAX_CANDIDATES = 1000
+NEAR_MAX_KM = 500
+
 #----------------------------------------------------------------------------#
 # Models.
 #----------------------------------------------------------------------------#
@@ -53,13 +84,34 @@ class Venue(db.Model):
     seeking_talent = db.Column(db.Boolean(), default=False)
     seeking_description = db.Column(db.String(500))
     genres = db.Column(db.ARRAY(db.String), nullable=False)
-    shows = db.relationship('Show', backref='venue', cascade="all, delete", lazy=True)
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    updated_at = db.Column(db.DateTime, nullable=False, index=True,
+      default=db.func.now(), onupdate=db.func.now(), server_default=db.func.now())
+
+    """
+      Coordinates filled in by the geocode-venues command, and the grid
+      cell of geo.grid_cell() they fall in, whose index prunes /venues/near
+      to a few range scans. All three are NULL until the venue is geocoded.
+    """
+
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+    grid_cell = db.Column(db.Integer, index=True)
+    shows = db.relationship('Show', backref='venue', cascade="all, delete", lazy=True, passive_deletes=True)
     """
       Constraint based on the assumption that there will not be two venues
       with the same name and address
     """
 
-    __table_args__ = (db.UniqueConstraint('name', 'city', 'state', 'address'), )
+    __table_args__ = (
+      db.UniqueConstraint('name', 'city', 'state', 'address'),
+      db.Index('ix_Venues_name_trgm', 'name', postgresql_using='gin',
+        postgresql_ops={'name': 'gin_trgm_ops'}),
+      db.Index('ix_Venues_lower_name_pattern', db.text('lower(name) text_pattern_ops')),
+      db.Index('ix_Venues_genres', 'genres', postgresql_using='gin'),
+    )
 
     # TODO: implement any missing fields, as a database migration using Flask-Migrate
     
@@ -76,6 +128,93 @@ class Venue(db.Model):
 
       return temp_dict
 
+    @staticmethod
+    def _get_areas(genres=None):
+
+      """
+        Helper function for venues()
+
+        Builds the city/state -> venues -> num_upcoming_shows tree from a
+        single query instead of one query per area and per venue. When
+        genres are given only venues listing all of them are included.
+        Venues are read as reads.VenueRow objects, without the ORM.
+      """
+
+      statement = db.select([
+        Venue.id,
+        Venue.name,
+        Venue.city,
+        Venue.state,
+        Venue.upcoming_shows_count
+      ])
+
+      if genres:
+        statement = statement.where(Venue.genres.contains(db.cast(genres, db.ARRAY(db.String))))
+
+      rows = reads.fetch(db.session.connection(),
+        statement.order_by(Venue.city, Venue.state, Venue.id), reads.VenueRow)
+
+      areas = []
+
+      for row in rows:
+
+        if not areas or (areas[-1]['city'], areas[-1]['state']) != (row.city, row.state):
+          areas.append({
+            'city': row.city,
+            'state': row.state,
+            'venues': []
+          })
+
+        areas[-1]['venues'].append(row)
+
+      return areas
+
+    @staticmethod
+    def _get_detail(venue_id):
+
+      """
+        Helper function for show_venue()
+
+        Loads the venue, all of its shows and the performing artists in one
+        joined query. Returns None if the venue does not exist.
+      """
+
+      rows = db.session.query(
+        Venue,
+        Show.start_time,
+        Show.is_past,
+        Artist.id,
+        Artist.name,
+        Artist.image_link
+      ).outerjoin(Show, Show.venue_id == Venue.id
+      ).outerjoin(Artist, Artist.id == Show.artist_id
+      ).filter(Venue.id == venue_id
+      ).order_by(Show.start_time
+      ).all()
+
+      if not rows:
+        return None
+
+      venue = rows[0][0]
+
+      shows = [(is_past, {
+        'venue_id': venue.id,
+        'venue_name': venue.name,
+        'venue_image_link': venue.image_link,
+        'artist_id': artist_id,
+        'artist_name': artist_name,
+        'artist_image_link': artist_image_link,
+        'start_time': start_time
+      }) for _, start_time, is_past, artist_id, artist_name, artist_image_link in rows
+        if start_time is not None]
+
+      data = venue._create_individual_venue_dict_2()
+      data.update(Show._split_show_dicts(shows))
+      data['past_shows_count'] = venue.past_shows_count
+      data['upcoming_shows_count'] = venue.upcoming_shows_count
+
+      return data
+
     def _create_individual_venue_dict_2(self):
       """ 
         Helper function for show_venue() and edit_venue()
@@ -112,14 +251,25 @@ class Artist(db.Model):
     seeking_venue = db.Column(db.Boolean(), default=False)
     seeking_description = db.Column(db.String(500))
     genres = db.Column(db.ARRAY(db.String), nullable=False)
-    shows = db.relationship('Show', backref='artist', cascade ='all, delete', lazy=True)
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    updated_at = db.Column(db.DateTime, nullable=False, index=True,
+      default=db.func.now(), onupdate=db.func.now(), server_default=db.func.now())
+    shows = db.relationship('Show', backref='artist', cascade ='all, delete', lazy=True, passive_deletes=True)
 
     """
       Constraint based on the assumption that there will not be two venues
       with the same name, city and genres
     """
 
-    __table_args__ = (db.UniqueConstraint('name', 'city', 'state', 'genres'), )
+    __table_args__ = (
+      db.UniqueConstraint('name', 'city', 'state', 'genres'),
+      db.Index('ix_Artists_name_trgm', 'name', postgresql_using='gin',
+        postgresql_ops={'name': 'gin_trgm_ops'}),
+      db.Index('ix_Artists_lower_name_pattern', db.text('lower(name) text_pattern_ops')),
+      db.Index('ix_Artists_genres', 'genres', postgresql_using='gin'),
+    )
 
     def _create_individual_artist_dict(self):
 
@@ -159,76 +309,809 @@ class Artist(db.Model):
 
       return temp_dict
 
+    @staticmethod
+    def _get_detail(artist_id):
+
+      """
+        Helper function for show_artist()
+
+        Loads the artist, all of their shows and the venues in one joined
+        query. Returns None if the artist does not exist.
+      """
+
+      rows = db.session.query(
+        Artist,
+        Show.start_time,
+        Show.is_past,
+        Venue.id,
+        Venue.name,
+        Venue.image_link
+      ).outerjoin(Show, Show.artist_id == Artist.id
+      ).outerjoin(Venue, Venue.id == Show.venue_id
+      ).filter(Artist.id == artist_id
+      ).order_by(Show.start_time
+      ).all()
+
+      if not rows:
+        return None
+
+      artist = rows[0][0]
+
+      shows = [(is_past, {
+        'venue_id': venue_id,
+        'venue_name': venue_name,
+        'venue_image_link': venue_image_link,
+        'artist_id': artist.id,
+        'artist_name': artist.name,
+        'artist_image_link': artist.image_link,
+        'start_time': start_time
+      }) for _, start_time, is_past, venue_id, venue_name, venue_image_link in rows
+        if start_time is not None]
+
+      data = artist._create_individual_artist_dict_2()
+      data.update(Show._split_show_dicts(shows))
+      data['past_shows_count'] = artist.past_shows_count
+      data['upcoming_shows_count'] = artist.upcoming_shows_count
+
+      return data
+
 
 class Show(db.Model):
   __tablename__ = 'Shows' 
 
-  venue_id =  db.Column(db.Integer, db.ForeignKey('Venues.id'), primary_key=True)
-  artist_id = db.Column(db.Integer, db.ForeignKey('Artists.id'), primary_key=True)
+  venue_id =  db.Column(db.Integer, db.ForeignKey('Venues.id', ondelete='CASCADE'), primary_key=True)
+  artist_id = db.Column(db.Integer, db.ForeignKey('Artists.id', ondelete='CASCADE'), primary_key=True)
   start_time = db.Column(db.DateTime(), primary_key=True)
 
+  """
+    Whether the show is counted in past_shows_count rather than
+    upcoming_shows_count of its venue and artist. Set on insert and flipped
+    by the rollover-show-counters command once start_time has passed.
+  """
+
+  is_past = db.Column(db.Boolean(), nullable=False, default=False, server_default='false')
+
+  """
+    [start_time, end) of the show. The same_artist_overlapping_time
+    exclusion constraint of each partition stops an artist from being
+    booked for two shows whose ranges overlap, and its GiST index serves
+    availability lookups.
+  """
+
+  time_range = db.Column(TSRANGE(), nullable=False)
+
+  updated_at = db.Column(db.DateTime, nullable=False, index=True,
+    default=db.func.now(), onupdate=db.func.now(), server_default=db.func.now())
+
   """
     Constraint on the assumption that an artist cannot be at more than one venue at one time but
     a single venue may have multiple stages.
 
+    Shows are range partitioned by month on start_time, see partitions.py,
+    so that queries bounded by start_time only touch the matching months.
+
   """
 
-  __table_args__ = (db.UniqueConstraint('artist_id', 'start_time', name='same_artist_start_time'), )
+  __table_args__ = (
+    db.UniqueConstraint('artist_id', 'start_time', name='same_artist_start_time'),
+    db.Index('ix_Shows_upcoming_start_time', 'start_time',
+      postgresql_where=db.text('NOT is_past')),
+    db.Index('ix_Shows_artist_id_start_time', 'artist_id', 'start_time'),
+    db.Index('ix_Shows_venue_id_start_time', 'venue_id', 'start_time'),
+    db.Index('ix_Shows_start_time_venue_id_artist_id', 'start_time', 'venue_id', 'artist_id'),
+    {'postgresql_partition_by': 'RANGE (start_time)'}
+  )
+
+  @staticmethod
+  def _time_range(start_time, duration=None):
 
-  def _create_individual_show_dict(self):
     """
-      Helper function for shows()
+      Helper function for create_show_submission() and the insert listener
     """
 
-    temp_dict = {
-      'venue_id': self.venue_id,
-      'venue_name': self.venue.name,
-      'artist_id': self.artist_id,
-      'artist_name': self.artist.name,
-      'artist_image_link': self.artist.image_link,
-      'start_time': self.start_time.strftime("%Y-%m-%d %H:%M:%S")
-    }
+    if duration is None:
+      duration = app.config['SHOW_DEFAULT_DURATION_MINUTES']
 
+    return DateTimeRange(start_time, start_time + datetime.timedelta(minutes=duration), '[)')
 
-    return temp_dict
+  @staticmethod
+  def _change_key(venue_id, artist_id, start_time):
 
-  def _create_individual_show_dict_2(self):
+    """
+      Helper function for the change feed
 
+      Shows have no id of their own, so the feed identifies them by
+      venue_id|artist_id|start_time. Must match SHOW_CHANGE_KEY_SQL.
     """
-      Helper function for show_venue()
+
+    return '{}|{}|{}'.format(venue_id, artist_id, start_time.strftime('%Y-%m-%dT%H:%M:%S.%f'))
+
+  @staticmethod
+  def _split_show_dicts(shows):
 
     """
+      Helper function for Venue._get_detail() and Artist._get_detail()
 
-    temp_dict = {
-      'venue_id': self.venue_id,
-      'venue_name': self.venue.name,
-      'venue_image_link': self.venue.image_link,
+      Takes (is_past, show dict) pairs and returns the past/upcoming lists
+      expected by the detail templates. Splitting on is_past rather than on
+      the clock keeps the lists in step with the stored show counters.
+    """
 
-      'artist_id': self.artist_id,
-      'artist_name': self.artist.name,
-      'artist_image_link': self.artist.image_link,
-      'start_time': self.start_time.strftime("%Y-%m-%d %H:%M:%S")
-      
-    
+    return {
+      'past_shows': [show for is_past, show in shows if is_past],
+      'upcoming_shows': [show for is_past, show in shows if not is_past]
     }
 
-    return temp_dict
-
     # TODO: implement any missing fields, as a database migration using Flask-Migrate
 
+SHOW_CHANGE_KEY_SQL = """concat_ws('|', venue_id, artist_id, to_char(start_time, 'YYYY-MM-DD"T"HH24:MI:SS.US'))"""
+
+class Tombstone(db.Model):
+  __tablename__ = 'Tombstones'
+
+  """
+    Record of a deleted venue, artist or show, kept so that /changes can
+    report deletions to clients syncing incrementally. key is the entity id,
+    or Show._change_key() for shows.
+  """
+
+  id = db.Column(db.Integer, primary_key=True)
+  kind = db.Column(db.String(16), nullable=False)
+  key = db.Column(db.String, nullable=False)
+  deleted_at = db.Column(db.DateTime, nullable=False, index=True,
+    default=db.func.now(), server_default=db.func.now())
+
+class RenderedPage(db.Model):
+  __tablename__ = 'RenderedPages'
+
+  """
+    Prerendered detail pages, keyed by 'venue:<id>' or 'artist:<id>', used
+    when PRERENDER_PAGES = 'table'. See prerender.py.
+  """
+
+  key = db.Column(db.String, primary_key=True)
+  body = db.Column(db.LargeBinary, nullable=False)
+  rendered_at = db.Column(db.DateTime, nullable=False,
+    default=db.func.now(), server_default=db.func.now())
+
+prerendered.init_app(app, RenderedPage.__table__, lambda: db.engine)
+
+class SimilarityBucket(db.Model):
+  __tablename__ = 'SimilarityBuckets'
+
+  """
+    LSH band keys of the MinHash signature of each venue and artist over
+    its genres and location, see related.py. Venues and artists sharing a
+    band_key are the candidates compared when a neighbour list is refreshed.
+  """
+
+  kind = db.Column(db.String(16), primary_key=True)
+  entity_id = db.Column(db.Integer, primary_key=True)
+  band_key = db.Column(db.BigInteger, primary_key=True, index=True)
+
+class RelatedEntity(db.Model):
+  __tablename__ = 'RelatedEntities'
+
+  """
+    Top RELATED_PER_KIND most similar venues and artists of each venue and
+    artist, by Jaccard similarity of genres and location. Built by the
+    build-related command and refreshed on create and edit.
+  """
+
+  kind = db.Column(db.String(16), primary_key=True)
+  entity_id = db.Column(db.Integer, primary_key=True)
+  related_kind = db.Column(db.String(16), primary_key=True)
+  related_id = db.Column(db.Integer, primary_key=True)
+  score = db.Column(db.Float, nullable=False)
+
+  __table_args__ = (
+    db.Index('ix_RelatedEntities_related_kind_related_id', 'related_kind', 'related_id'),
+  )
+
 # TODO Implement Show and Artist models, and complete all model relationships and properties, as a database migration.
 
+def _update_show_counters(connection, show, delta):
+
+  """
+    Helper function for the Show insert and delete listeners
+
+    Adds delta to the past or upcoming show counter of the show's venue and
+    artist, in the same transaction as the flush.
+  """
+
+  column = 'past_shows_count' if show.is_past else 'upcoming_shows_count'
+
+  for model, entity_id in ((Venue, show.venue_id), (Artist, show.artist_id)):
+    table = model.__table__
+    connection.execute(
+      table.update().where(table.c.id == entity_id).values({column: table.c[column] + delta}))
+
+@event.listens_for(Show.__table__, 'after_create')
+def _create_default_show_partition(target, connection, **kw):
+  partitions.create_default_partition(connection)
+  partitions.create_overlap_trigger(connection)
+
+@event.listens_for(Show, 'before_insert')
+def _set_show_is_past(mapper, connection, target):
+  target.is_past = target.start_time < datetime.datetime.now()
+
+  if target.time_range is None:
+    target.time_range = Show._time_range(target.start_time)
+
+@event.listens_for(Show, 'after_insert')
+def _increment_show_counters(mapper, connection, target):
+  _update_show_counters(connection, target, 1)
+
+@event.listens_for(Show, 'after_delete')
+def _decrement_show_counters(mapper, connection, target):
+  _update_show_counters(connection, target, -1)
+
+@event.listens_for(Show, 'after_delete')
+def _record_show_tombstone(mapper, connection, target):
+  connection.execute(Tombstone.__table__.insert().values(
+    kind='show', key=Show._change_key(target.venue_id, target.artist_id, target.start_time)))
+
+def _prerender_pages(venue_ids=(), artist_ids=(), related=()):
+
+  """
+    Helper function for the write handlers and the rollover commands
+
+    Re-renders the prerendered detail pages of the given venues and
+    artists, and of the (kind, id) pairs in related, if prerendering is
+    enabled. Pages of deleted entities are removed.
+  """
+
+  prerendered.refresh('venue', list(venue_ids) + [i for kind, i in related if kind == 'venue'])
+  prerendered.refresh('artist', list(artist_ids) + [i for kind, i in related if kind == 'artist'])
+
+def _related_referrers(kind, ids):
+
+  """
+    Helper function for the edit and delete handlers of venues and artists
+
+    Returns the (kind, id) pairs of the venues and artists whose related
+    sections list one of the given venues or artists, as their pages show
+    its name and image.
+  """
+
+  return db.session.query(RelatedEntity.kind, RelatedEntity.entity_id).filter(
+    RelatedEntity.related_kind == kind, RelatedEntity.related_id.in_(ids)
+  ).distinct().all()
+
+def _delete_entities(model, ids):
+
+  """
+    Helper function for delete_venue(), delete_artist() and the bulk delete
+    endpoints
+
+    Deletes the venues or artists with the given ids in one statement and
+    lets ON DELETE CASCADE remove their shows. As the cascaded shows bypass
+    the Show delete listener, the counters of the artists (or venues) they
+    belonged to are decremented first in a single grouped UPDATE, and
+    tombstones are written for the deleted rows and their shows so that
+    /changes reports them. Returns the number of deleted rows, the ids of
+    those counterparts and the (kind, id) pairs of the entities whose
+    related sections listed the deleted rows. The caller commits.
+  """
+
+  if model is Venue:
+    key, other_key, other_table = 'venue_id', 'artist_id', 'Artists'
+  else:
+    key, other_key, other_table = 'artist_id', 'venue_id', 'Venues'
+
+  # FOR UPDATE blocks new shows for these rows until the transaction ends,
+  # since inserting a show takes a KEY SHARE lock on both referenced rows
+  ids = [row.id for row in db.session.query(model.id).filter(
+    model.id.in_(ids)).with_for_update()]
+
+  if not ids:
+    return 0, [], []
+
+  other_ids = [row[0] for row in db.session.execute(db.text('''
+    UPDATE "{table}" AS t SET
+      upcoming_shows_count = t.upcoming_shows_count - d.upcoming,
+      past_shows_count = t.past_shows_count - d.past,
+      updated_at = now()
+    FROM (
+      SELECT {other_key} AS id,
+        count(*) FILTER (WHERE NOT is_past) AS upcoming,
+        count(*) FILTER (WHERE is_past) AS past
+      FROM "Shows" WHERE {key} = ANY(:ids) GROUP BY {other_key}
+    ) d
+    WHERE t.id = d.id
+    RETURNING t.id
+  '''.format(table=other_table, key=key, other_key=other_key)), {'ids': ids})]
+
+  db.session.execute(db.text('''
+    INSERT INTO "Tombstones" (kind, key, deleted_at)
+    SELECT 'show', {show_key}, now() FROM "Shows" WHERE {key} = ANY(:ids)
+    UNION ALL
+    SELECT :kind, id::text, now() FROM unnest(CAST(:ids AS integer[])) AS id
+  '''.format(show_key=SHOW_CHANGE_KEY_SQL, key=key)), {
+    'ids': ids,
+    'kind': 'venue' if model is Venue else 'artist'
+  })
+
+  kind = 'venue' if model is Venue else 'artist'
+  referrers = [(k, i) for k, i in _related_referrers(kind, ids) if k != kind or i not in ids]
+
+  db.session.query(RelatedEntity).filter(db.or_(
+    db.and_(RelatedEntity.kind == kind, RelatedEntity.entity_id.in_(ids)),
+    db.and_(RelatedEntity.related_kind == kind, RelatedEntity.related_id.in_(ids))
+  )).delete(synchronize_session=False)
+  db.session.query(SimilarityBucket).filter(
+    SimilarityBucket.kind == kind, SimilarityBucket.entity_id.in_(ids)
+  ).delete(synchronize_session=False)
+
+  deleted = db.session.query(model).filter(model.id.in_(ids)).delete(synchronize_session=False)
+
+  return deleted, other_ids, referrers
+
+def _get_related(kind, entity_id):
+
+  """
+    Helper function for _render_venue_page() and _render_artist_page()
+
+    Reads the precomputed neighbours of a venue or artist with one lookup
+    on the RelatedEntities primary key, joined to their names and images.
+  """
+
+  rows = db.session.query(
+    RelatedEntity.related_kind,
+    RelatedEntity.related_id,
+    db.func.coalesce(Venue.name, Artist.name),
+    db.func.coalesce(Venue.image_link, Artist.image_link)
+  ).outerjoin(Venue, db.and_(RelatedEntity.related_kind == 'venue', Venue.id == RelatedEntity.related_id)
+  ).outerjoin(Artist, db.and_(RelatedEntity.related_kind == 'artist', Artist.id == RelatedEntity.related_id)
+  ).filter(RelatedEntity.kind == kind, RelatedEntity.entity_id == entity_id
+  ).order_by(RelatedEntity.related_kind, RelatedEntity.score.desc(), RelatedEntity.related_id
+  ).all()
+
+  return {
+    'related_venues': [{'id': related_id, 'name': name, 'image_link': image_link}
+      for related_kind, related_id, name, image_link in rows if related_kind == 'venue'],
+    'related_artists': [{'id': related_id, 'name': name, 'image_link': image_link}
+      for related_kind, related_id, name, image_link in rows if related_kind == 'artist']
+  }
+
+def _refresh_related(kind, entity_id):
+
+  """
+    Helper function for the create and edit handlers of venues and artists
+
+    Re-buckets one venue or artist and recomputes its neighbour list from
+    the entities sharing one of its LSH buckets. It is also inserted into,
+    or removed from, those entities' lists, which are trimmed back to
+    RELATED_PER_KIND. Lists it drops out of are not backfilled until the
+    next build-related run. Failures are logged and rolled back, as the
+    entity itself is already committed.
+  """
+
+  model = Venue if kind == 'venue' else Artist
+  buckets = SimilarityBucket.__table__
+  neighbours = RelatedEntity.__table__
+
+  try:
+    entity = db.session.query(model.genres, model.city, model.state).filter(model.id == entity_id).first()
+
+    if entity is None:
+      return
+
+    tokens = related.features(entity.genres, entity.city, entity.state)
+    band_keys = sorted(set(related.band_keys(related.signature(tokens))))
+
+    db.session.execute(buckets.delete().where(db.and_(
+      buckets.c.kind == kind, buckets.c.entity_id == entity_id)))
+    db.session.execute(buckets.insert(), [
+      {'kind': kind, 'entity_id': entity_id, 'band_key': band_key} for band_key in band_keys])
+
+    candidate_keys = db.session.query(SimilarityBucket.kind, SimilarityBucket.entity_id
+    ).filter(SimilarityBucket.band_key.in_(band_keys)
+    ).distinct().limit(RELATED_MAX_CANDIDATES).all()
+
+    candidates = {}
+
+    for candidate_kind, candidate_model in (('venue', Venue), ('artist', Artist)):
+      ids = [candidate_id for k, candidate_id in candidate_keys if k == candidate_kind]
+
+      if ids:
+        for row in db.session.query(candidate_model.id, candidate_model.genres, candidate_model.city,
+          candidate_model.state).filter(candidate_model.id.in_(ids)):
+          candidates[(candidate_kind, row.id)] = related.features(row.genres, row.city, row.state)
+
+    # the entity's own list
+    db.session.execute(neighbours.delete().where(db.and_(
+      neighbours.c.kind == kind, neighbours.c.entity_id == entity_id)))
+
+    rows = [{'kind': kind, 'entity_id': entity_id, 'related_kind': related_kind,
+      'related_id': related_id, 'score': score}
+      for related_kind, related_id, score in related.top_neighbours(
+        (kind, entity_id), tokens, candidates, RELATED_PER_KIND)]
+
+    if rows:
+      db.session.execute(neighbours.insert(), rows)
+
+    # the lists it appears in
+    affected = set(db.session.execute(neighbours.delete().where(db.and_(
+      neighbours.c.related_kind == kind, neighbours.c.related_id == entity_id)
+    ).returning(neighbours.c.kind, neighbours.c.entity_id)).fetchall())
+
+    rows = [{'kind': candidate_kind, 'entity_id': candidate_id, 'related_kind': kind,
+      'related_id': entity_id, 'score': score}
+      for (candidate_kind, candidate_id), candidate_tokens in candidates.items()
+      for score in [related.jaccard(tokens, candidate_tokens)]
+      if score > 0 and (candidate_kind, candidate_id) != (kind, entity_id)]
+
+    if rows:
+      db.session.execute(neighbours.insert(), rows)
+      db.session.execute(db.text('''
+        DELETE FROM "RelatedEntities" r USING (
+          SELECT kind, entity_id, related_id,
+            row_number() OVER (PARTITION BY kind, entity_id ORDER BY score DESC, related_id) AS rank
+          FROM "RelatedEntities"
+          WHERE related_kind = :kind AND (kind, entity_id) IN (
+            SELECT * FROM unnest(CAST(:kinds AS varchar[]), CAST(:ids AS integer[])))
+        ) ranked
+        WHERE ranked.rank > :top_k
+          AND r.kind = ranked.kind AND r.entity_id = ranked.entity_id
+          AND r.related_kind = :kind AND r.related_id = ranked.related_id
+      '''), {
+        'kind': kind,
+        'kinds': [row['kind'] for row in rows],
+        'ids': [row['entity_id'] for row in rows],
+        'top_k': RELATED_PER_KIND
+      })
+
+      affected.update(db.session.query(RelatedEntity.kind, RelatedEntity.entity_id).filter(
+        RelatedEntity.related_kind == kind, RelatedEntity.related_id == entity_id).all())
+
+    db.session.commit()
+
+  except:
+    db.session.rollback()
+    app.logger.exception('refreshing related entities of %s %s failed', kind, entity_id)
+    return
+
+  venue_ids = [i for k, i in affected if k == 'venue']
+
+  if venue_ids:
+    response_cache.invalidate(*['venue:' + str(i) for i in venue_ids])
+
+  _prerender_pages(
+    venue_ids=venue_ids,
+    artist_ids=[i for k, i in affected if k == 'artist'])
+
+def _update_changed_columns(model, entity, values, version):
+
+  """
+    Helper function for edit_venue_submission() and edit_artist_submission()
+
+    Diffs the submitted values against the stored row and issues a single
+    UPDATE of the changed columns only, guarded by the version the editor
+    loaded the form with. Returns the names of the changed columns, or None
+    if the row was edited by someone else in the meantime.
+  """
+
+  if version is None or entity.version != version:
+    return None
+
+  changes = {name: value for name, value in values.items() if getattr(entity, name) != value}
+
+  if not changes:
+    return []
+
+  updated = db.session.query(model).filter(
+    model.id == entity.id, model.version == version
+  ).update(dict(changes, version=model.version + 1), synchronize_session=False)
+
+  if not updated:
+    return None
+
+  return list(changes)
+
+def _autocomplete(model, tag):
+
+  """
+    Helper function for autocomplete_venues() and autocomplete_artists()
+
+    Returns the first names starting with the q argument, case-insensitively,
+    as a prefix range scan on the lower(name) text_pattern_ops index. The
+    index is ordered by the ~<~ operator of that operator class rather than
+    by the collation, so the results are sorted the same way for Postgres to
+    stop after limit rows instead of sorting every match. Results are kept
+    in prefix_cache under tag and the normalised prefix.
+  """
+
+  prefix = request.args.get('q', '').strip().lower()
+  limit = min(max(request.args.get('limit', 10, type=int), 1), AUTOCOMPLETE_MAX_RESULTS)
+
+  results = prefix_cache.get(tag, (prefix, limit)) if prefix else []
+
+  if results is None:
+    escaped_prefix = prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    lower_name = db.func.lower(model.name)
+
+    results = [{'id': row.id, 'name': row.name} for row in db.session.query(model.id, model.name
+    ).filter(lower_name.like(escaped_prefix + '%', escape='\\')
+    ).order_by(db.text('lower("{}".name) USING ~<~'.format(model.__tablename__)), model.id
+    ).limit(limit)]
+
+    prefix_cache.set(tag, (prefix, limit), results)
+
+  return jsonify({
+    'success': True,
+    'results': results
+  })
+
+def _search_by_name(model, search_term, page=1):
+
+  """
+    Helper function for search_venues() and search_artists()
+
+    Matches names by substring or by trigram word similarity so that typos
+    still return results, both served by the gin_trgm_ops index on name.
+    Results are ranked by similarity and paginated, and the total match
+    count comes from a window over the same query.
+  """
+
+  escaped_term = search_term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+  similarity = db.func.word_similarity(search_term, model.name)
+
+  rows = db.session.query(
+    model.id,
+    model.name,
+    model.upcoming_shows_count.label('num_upcoming_shows'),
+    db.func.count().over().label('total')
+  ).filter(db.or_(
+    model.name.ilike('%{}%'.format(escaped_term), escape='\\'),
+    db.literal(search_term).op('<%')(model.name)
+  )).order_by(similarity.desc(), model.name, model.id
+  ).limit(SEARCH_RESULTS_PER_PAGE
+  ).offset((page - 1) * SEARCH_RESULTS_PER_PAGE
+  ).all()
+
+  return {
+    'count': rows[0].total if rows else 0,
+    'page': page,
+    'per_page': SEARCH_RESULTS_PER_PAGE,
+    'data': [{
+      'id': row.id,
+      'name': row.name,
+      'num_upcoming_shows': row.num_upcoming_shows
+    } for row in rows]
+  }
+
+def _encode_cursor(values):
+
+  """
+    Helper function for _keyset_page()
+  """
+
+  return base64.urlsafe_b64encode(json.dumps(values, default=str).encode()).decode()
+
+def _decode_cursor(cursor):
+
+  """
+    Helper function for artists() and shows()
+
+    Returns None when no cursor was given and aborts with 400 on a cursor
+    that was not produced by _encode_cursor().
+  """
+
+  if not cursor:
+    return None
+
+  try:
+    values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+  except (ValueError, TypeError):
+    abort(400)
+
+  if not isinstance(values, list):
+    abort(400)
+
+  return values
+
+def _keyset_page(statement, keys, row_class, cursor_of, after=None, before=None, per_page=LISTING_PER_PAGE):
+
+  """
+    Helper function for artists() and shows()
+
+    Returns one page of the Core select statement ordered by the keys
+    tuple, starting strictly after or ending strictly before the given key
+    values, as row_class objects (see reads.fetch()). cursor_of maps a row
+    to its key values and is used to build the previous/next cursors.
+  """
+
+  key = db.tuple_(*keys)
+
+  if before is not None:
+    statement = statement.where(key < tuple(before)).order_by(*[k.desc() for k in keys])
+  else:
+    if after is not None:
+      statement = statement.where(key > tuple(after))
+    statement = statement.order_by(*keys)
+
+  rows = reads.fetch(db.session.connection(), statement.limit(per_page + 1), row_class)
+
+  has_more = len(rows) > per_page
+  rows = rows[:per_page]
+
+  if before is not None:
+    rows.reverse()
+    has_previous, has_next = has_more, True
+  else:
+    has_previous, has_next = after is not None, has_more
+
+  return {
+    'rows': rows,
+    'previous_cursor': _encode_cursor(cursor_of(rows[0])) if rows and has_previous else None,
+    'next_cursor': _encode_cursor(cursor_of(rows[-1])) if rows and has_next else None
+  }
+
+def _show_filters():
+
+  """
+    Helper function for shows() and export_shows()
+
+    Reads the from/to/venue_id/artist_id query arguments and returns the
+    filters to carry over into pagination links along with the matching
+    Show criteria. from is inclusive and to is exclusive.
+  """
+
+  filters = {}
+  criteria = []
+
+  for name in ('from', 'to'):
+    value = request.args.get(name)
+
+    if value:
+      try:
+        moment = dateutil.parser.parse(value)
+      except (ValueError, OverflowError):
+        abort(400)
+
+      filters[name] = value
+      criteria.append(Show.start_time >= moment if name == 'from' else Show.start_time < moment)
+
+  for name, column in (('venue_id', Show.venue_id), ('artist_id', Show.artist_id)):
+    value = request.args.get(name, type=int)
+
+    if value is not None:
+      filters[name] = value
+      criteria.append(column == value)
+
+  return filters, criteria
+
+def _show_listing_query(criteria):
+
+  """
+    Helper function for shows() and export_shows()
+
+    Selects only the show, venue and artist columns the listings use, in
+    the order of reads.ShowRow.
+  """
+
+  statement = db.select([
+    Show.start_time,
+    Show.venue_id,
+    Show.artist_id,
+    Venue.name.label('venue_name'),
+    Artist.name.label('artist_name'),
+    Artist.image_link.label('artist_image_link')
+  ]).select_from(Show.__table__
+  .join(Venue.__table__, Venue.id == Show.venue_id)
+  .join(Artist.__table__, Artist.id == Show.artist_id))
+
+  for criterion in criteria:
+    statement = statement.where(criterion)
+
+  return statement
+
+def _get_changes(since=None, limit=CHANGES_PER_PAGE):
+
+  """
+    Helper function for changes()
+
+    Returns up to limit changes ordered by (changed_at, kind, key), starting
+    strictly after the since key values. Each branch of the union is a range
+    scan on its updated_at (or deleted_at) index. Rows that were modified
+    are returned whole as data; deletions come from the tombstones and have
+    no data.
+
+    changed_at is set when the writing transaction starts, not when it
+    commits, so only changes older than CHANGES_SAFETY_LAG_SECONDS are
+    returned. Otherwise a transaction still in flight could commit rows
+    stamped before a cursor already handed out, and they would never be
+    served.
+  """
+
+  if since is None:
+    since = [datetime.datetime.min, '', '']
+
+  # each branch returns its own first limit rows in the outer order, so a
+  # page reads at most limit + 1 rows per table off the updated_at (or
+  # deleted_at) index instead of sorting everything since the cursor
+  rows = db.session.execute(db.text('''
+    SELECT * FROM (
+      (SELECT 'venue' AS kind, v.id::text AS key, v.updated_at AS changed_at, false AS deleted, row_to_json(v) AS data
+      FROM "Venues" v
+      WHERE v.updated_at >= :changed_at AND v.updated_at < {until}
+        AND (v.updated_at, 'venue', v.id::text) > (:changed_at, :kind, :key)
+      ORDER BY v.updated_at, v.id::text LIMIT :limit)
+      UNION ALL
+      (SELECT 'artist', a.id::text, a.updated_at, false, row_to_json(a)
+      FROM "Artists" a
+      WHERE a.updated_at >= :changed_at AND a.updated_at < {until}
+        AND (a.updated_at, 'artist', a.id::text) > (:changed_at, :kind, :key)
+      ORDER BY a.updated_at, a.id::text LIMIT :limit)
+      UNION ALL
+      (SELECT 'show', {show_key}, updated_at, false,
+        json_build_object('venue_id', venue_id, 'artist_id', artist_id, 'start_time', start_time)
+      FROM "Shows"
+      WHERE updated_at >= :changed_at AND updated_at < {until}
+        AND (updated_at, 'show', {show_key}) > (:changed_at, :kind, :key)
+      ORDER BY updated_at, {show_key} LIMIT :limit)
+      UNION ALL
+      (SELECT t.kind, t.key, t.deleted_at, true, NULL
+      FROM "Tombstones" t
+      WHERE t.deleted_at >= :changed_at AND t.deleted_at < {until}
+        AND (t.deleted_at, t.kind, t.key) > (:changed_at, :kind, :key)
+      ORDER BY t.deleted_at, t.kind, t.key LIMIT :limit)
+    ) c
+    ORDER BY c.changed_at, c.kind, c.key
+    LIMIT :limit
+  '''.format(show_key=SHOW_CHANGE_KEY_SQL, until="now() - :lag * interval '1 second'")), {
+    'changed_at': since[0],
+    'kind': since[1],
+    'key': since[2],
+    'lag': app.config['CHANGES_SAFETY_LAG_SECONDS'],
+    'limit': limit + 1
+  }).fetchall()
+
+  has_more = len(rows) > limit
+  rows = rows[:limit]
+
+  return {
+    'changes': [{
+      'kind': row.kind,
+      'key': row.key,
+      'op': 'delete' if row.deleted else 'upsert',
+      'changed_at': row.changed_at.isoformat(),
+      'data': row.data
+    } for row in rows],
+    'cursor': _encode_cursor([rows[-1].changed_at, rows[-1].kind, rows[-1].key]) if rows else None,
+    'has_more': has_more
+  }
+
 #----------------------------------------------------------------------------#
 # Filters.
 #----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-  date = dateutil.parser.parse(value)
-  if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format, locale='en')
+DATETIME_FORMATS = {
+  'full': "EEEE MMMM, d, y 'at' h:mma",
+  'medium': "EE MM, dd, y h:mma"
+}
+
+@functools.lru_cache(maxsize=None)
+def _datetime_pattern(format, locale):
+
+  """
+    Helper function for format_datetime()
+
+    Parses the Babel pattern and locale once per (format, locale) instead of
+    on every call.
+  """
+
+  return babel.dates.parse_pattern(DATETIME_FORMATS.get(format, format)), babel.Locale.parse(locale)
+
+def format_datetime(value, format='medium', locale='en'):
+  # show dicts carry datetime objects; strings are still accepted for
+  # templates that pass them
+  if isinstance(value, str):
+    value = dateutil.parser.parse(value)
+  pattern, locale = _datetime_pattern(format, locale)
+  return pattern.apply(value, locale)
 
 app.jinja_env.filters['datetime'] = format_datetime
 
@@ -261,36 +1144,16 @@ def index():
 #  ----------------------------------------------------------------
 
 @app.route('/venues')
+@response_cache.cached('venues')
 def venues():
   # TODO: replace with real venues data.
   #       num_shows should be aggregated based on number of upcoming shows per venue.
-  
-  data = []
-
-  areas = Venue.query.distinct('city', 'state').all()
 
-  for area in areas: 
+  genres = request.args.getlist('genre')
 
-    venues = Venue.query.filter(Venue.city == area.city,
-      Venue.state == area.state).all()
+  data = Venue._get_areas(genres)
 
-    venue_dict = []
-
-    for venue in venues:
-      current_venue = venue._create_individual_venue_dict()
-      upcoming_shows = Show.query.filter_by(venue_id = venue.id).filter(Show.start_time >= datetime.datetime.now()).all()
-      current_venue['num_upcoming_shows'] = len(upcoming_shows)
-      venue_dict.append(venue._create_individual_venue_dict())
-
-    temp = {
-      'city': area.city,
-      'state': area.state,
-      'venues': venue_dict
-    }
-
-    data.append(temp)
-
-  return render_template('pages/venues.html', areas=data);
+  return render_template('pages/venues.html', areas=data, genres=genres);
 
 @app.route('/venues/search', methods=['POST'])
 def search_venues():
@@ -298,62 +1161,117 @@ def search_venues():
   # seach for Hop should return "The Musical Hop".
   # search for "Music" should return "The Musical Hop" and "Park Square Live Music & Coffee"
   
-  query = request.form.get('search_term')
+  query = request.form.get('search_term', '')
+  page = request.form.get('page', 1, type=int)
 
-  print(query)
+  app.logger.info('venue search', extra={'search_term': query, 'page': page})
 
-  '''
-    https://knowledge.udacity.com/questions/83562
-  '''
+  response = _search_by_name(Venue, query, max(page, 1))
 
-  results = Venue.query.filter(Venue.name.ilike('%{}%'.format(query))).all()
+  return render_template('pages/search_venues.html', results=response, search_term=request.form.get('search_term', ''))
 
-  venue_list = []
+@app.route('/venues/near')
+def venues_near():
+  # venues within km (default 20) of lat/lng, or of the venue venue_id, nearest first
+
+  km = request.args.get('km', 20, type=float)
+  limit = min(max(request.args.get('limit', LISTING_PER_PAGE, type=int), 1), 1000)
+  venue_id = request.args.get('venue_id', type=int)
+
+  if venue_id is not None:
+    center = db.session.query(Venue.latitude, Venue.longitude).filter(Venue.id == venue_id).first()
+
+    if center is None:
+      abort(404)
+
+    latitude, longitude = center
+  else:
+    latitude = request.args.get('lat', type=float)
+    longitude = request.args.get('lng', type=float)
+
+  if latitude is None or longitude is None or not -90 <= latitude <= 90 or not -180 <= longitude <= 180:
+    abort(400)
+
+  if not 0 < km <= NEAR_MAX_KM:
+    abort(400)
+
+  boxes = geo.bounding_boxes(latitude, longitude, km)
+
+  # grid cell ranges for the index, the exact box to drop the corners of
+  # the edge cells
+  rows = db.session.query(
+    Venue.id,
+    Venue.name,
+    Venue.city,
+    Venue.state,
+    Venue.latitude,
+    Venue.longitude
+  ).filter(db.or_(*[db.and_(
+    db.or_(*[Venue.grid_cell.between(first, last) for first, last in geo.cell_ranges(box)]),
+    Venue.latitude.between(box[0], box[1]),
+    Venue.longitude.between(box[2], box[3])
+  ) for box in boxes])).all()
+
+  venues = []
+
+  for row in rows:
+    distance = geo.distance_km(latitude, longitude, row.latitude, row.longitude)
+
+    if distance <= km and row.id != venue_id:
+      venues.append({
+        'id': row.id,
+        'name': row.name,
+        'city': row.city,
+        'state': row.state,
+        'latitude': row.latitude,
+        'longitude': row.longitude,
+        'distance_km': round(distance, 3)
+      })
+
+  venues.sort(key=lambda venue: (venue['distance_km'], venue['id']))
+
+  return jsonify({
+    'success': True,
+    'latitude': latitude,
+    'longitude': longitude,
+    'km': km,
+    'venues': venues[:limit]
+  })
+
+@app.route('/venues/autocomplete')
+def autocomplete_venues():
+  # venue picker for the new show form
+  return _autocomplete(Venue, 'venue-names')
+
+@prerendered.renderer('venue', '/venues/{}')
+def _render_venue_page(venue_id):
 
-  for result in results:
+  """
+    Helper function for show_venue() and the prerendered venue pages
+  """
 
-    temp_dict = {}
-    temp_dict['id'] = result.id
-    temp_dict['name'] = result.name
-    temp_dict['num_upcoming_shows'] = Show.query.filter_by(venue_id = result.id).filter(Show.start_time >= datetime.datetime.now()).all()
+  data = Venue._get_detail(venue_id)
 
-    venue_list.append(temp_dict)
+  if data is None:
+    return None
 
-  response = {
-    'count': len(results),
-    'data': venue_list
-  }  
+  data.update(_get_related('venue', venue_id))
 
-  return render_template('pages/search_venues.html', results=response, search_term=request.form.get('search_term', ''))
+  return render_template('pages/show_venue.html', venue=data)
 
 @app.route('/venues/<int:venue_id>')
+@prerendered.serves('venue', 'venue_id')
+@response_cache.cached('venue:{venue_id}')
 def show_venue(venue_id):
   # shows the venue page with the given venue_id
   # TODO: replace with real venue data from the venues table, using venue_id
 
-  current_venue = Venue.query.get(venue_id)
-
-  past_shows = Show.query.filter_by(venue_id = venue_id).filter(Show.start_time < datetime.datetime.now()).all()
-  upcoming_shows = Show.query.filter_by(venue_id = venue_id).filter(Show.start_time >= datetime.datetime.now()).all()
-
-  past_shows_data = []
-  upcoming_shows_data = []
+  page = _render_venue_page(venue_id)
 
-  for show in past_shows:
+  if page is None:
+    abort(404)
 
-    past_shows_data.append(show._create_individual_show_dict_2())
-
-  for show in upcoming_shows:
-    upcoming_shows_data.append(show._create_individual_show_dict_2())
-
-  data = current_venue._create_individual_venue_dict_2()
-   
-  data['past_shows'] = past_shows_data
-  data['upcoming_shows'] = upcoming_shows_data
-  data['past_shows_count'] =  len(past_shows_data)
-  data['upcoming_shows_count'] = len(upcoming_shows_data)
-
-  return render_template('pages/show_venue.html', venue=data)
+  return page
 
 #  Create Venue
 #  ----------------------------------------------------------------
@@ -397,14 +1315,18 @@ def create_venue_submission():
       db.session.add(new_venue)
       db.session.commit()
 
+      response_cache.invalidate('genres', 'venues', 'venue-names')
+      _refresh_related('venue', new_venue.id)
+      _prerender_pages(venue_ids=[new_venue.id])
+
       flash('Venue ' + request.form['name'] + ' was successfully listed!')
 
-  except Exception as e:
+  except Exception:
 # TODO: on unsuccessful db insert, flash an error instead.
 # e.g., flash('An error occurred. Venue ' + data.name + ' could not be listed.')
 # see: http://flask.pocoo.org/docs/1.0/patterns/flashing/
 
-    print(e)
+    app.logger.exception('venue could not be listed')
     db.session.rollback()
 
     flash('Venue ' + request.form['name'] + ' could not be listed!')
@@ -418,7 +1340,7 @@ def create_venue_submission():
 
   return redirect(url_for('index'))
 
-@app.route('/venues/<venue_id>/delete', methods=['GET'])
+@app.route('/venues/<int:venue_id>/delete', methods=['GET'])
 def delete_venue(venue_id):
   # TODO: Complete this endpoint for taking a venue_id, and using
   # SQLAlchemy ORM to delete a record. Handle cases where the session commit could fail.
@@ -427,11 +1349,16 @@ def delete_venue(venue_id):
   # clicking that button delete it from the db then redirect the user to the homepage
 
   try:
-    current_venue = Venue.query.get(venue_id)
-    db.session.delete(current_venue)
+    deleted, artist_ids, referrers = _delete_entities(Venue, [venue_id])
     db.session.commit()
 
-    flash('Venue ' + str(venue_id) + ' was deleted!')
+    if deleted:
+      response_cache.invalidate('genres', 'venues', 'venue-names', 'venue:' + str(venue_id), 'shows',
+        *['venue:' + str(i) for kind, i in referrers if kind == 'venue'])
+      _prerender_pages(venue_ids=[venue_id], artist_ids=artist_ids, related=referrers)
+      flash('Venue ' + str(venue_id) + ' was deleted!')
+    else:
+      flash('Venue ' + str(venue_id) + ' could not be deleted!')
 
   except:
 
@@ -446,22 +1373,128 @@ def delete_venue(venue_id):
 
   return redirect(url_for('index'))
 
+@app.route('/csrf-token')
+def csrf_token():
+  # the JSON endpoints are CSRF protected like the forms; clients fetch a
+  # token here and send it back in the X-CSRFToken header, together with
+  # the session cookie this response sets
+  return jsonify({
+    'success': True,
+    'csrf_token': generate_csrf()
+  })
+
+def _bulk_delete(model):
+
+  """
+    Helper function for delete_venues() and delete_artists()
+
+    Expects a JSON body of the form {"ids": [1, 2, 3]} and, like every POST,
+    a CSRF token, here in the X-CSRFToken header (see csrf_token()).
+  """
+
+  body = request.get_json(silent=True) or {}
+  ids = body.get('ids')
+
+  if not isinstance(ids, list) or not ids or not all(type(i) is int for i in ids):
+    abort(400)
+
+  try:
+    deleted, other_ids, referrers = _delete_entities(model, ids)
+    db.session.commit()
+
+  except:
+    db.session.rollback()
+    app.logger.exception('bulk delete failed')
+
+    return jsonify({
+      'success': False
+    }), 500
+
+  finally:
+    db.session.close()
+
+  related_venue_tags = ['venue:' + str(i) for kind, i in referrers if kind == 'venue']
+
+  if model is Venue:
+    response_cache.invalidate('genres', 'venues', 'venue-names', 'shows',
+      *['venue:' + str(i) for i in ids] + related_venue_tags)
+    _prerender_pages(venue_ids=ids, artist_ids=other_ids, related=referrers)
+  else:
+    response_cache.invalidate('genres', 'artists', 'artist-names', 'shows',
+      *['venue:' + str(i) for i in other_ids] + related_venue_tags)
+    _prerender_pages(venue_ids=other_ids, artist_ids=ids, related=referrers)
+
+  return jsonify({
+    'success': True,
+    'deleted': deleted
+  })
+
+@app.route('/venues/delete', methods=['POST'])
+def delete_venues():
+  # deletes many venues at once, together with their shows
+  return _bulk_delete(Venue)
+
 #  Artists
 #  ----------------------------------------------------------------
 @app.route('/artists')
+@response_cache.cached('artists')
 def artists():
   # TODO: replace with real data returned from querying the database
 
 
-  data = []
-
-  all_artists = Artist.query.all()
-
-  for artist in all_artists: 
-
-    data.append(artist._create_individual_artist_dict())
-
-  return render_template('pages/artists.html', artists=data)
+  after = _decode_cursor(request.args.get('after'))
+  before = _decode_cursor(request.args.get('before'))
+
+  # cursor values are [id]
+  for cursor in (after, before):
+    if cursor is not None and [type(value) for value in cursor] != [int]:
+      abort(400)
+
+  genres = request.args.getlist('genre')
+
+  statement = db.select([Artist.id, Artist.name])
+
+  if genres:
+    statement = statement.where(Artist.genres.contains(db.cast(genres, db.ARRAY(db.String))))
+
+  page = _keyset_page(
+    statement,
+    [Artist.id],
+    reads.ArtistRow,
+    lambda row: [row.id],
+    after=after,
+    before=before
+  )
+
+  return render_template('pages/artists.html', artists=page['rows'], genres=genres,
+    previous_cursor=page['previous_cursor'], next_cursor=page['next_cursor'])
+
+@app.route('/genres')
+@response_cache.cached('genres')
+def genre_facets():
+  # number of venues and artists listing each genre, cached until the next venue or artist write
+
+  rows = db.session.execute(db.text('''
+    SELECT genre,
+      count(*) FILTER (WHERE kind = 'venue') AS venues,
+      count(*) FILTER (WHERE kind = 'artist') AS artists
+    FROM (
+      SELECT unnest(genres) AS genre, 'venue' AS kind FROM "Venues"
+      UNION ALL
+      SELECT unnest(genres) AS genre, 'artist' AS kind FROM "Artists"
+    ) g
+    GROUP BY genre
+    ORDER BY genre
+  '''))
+
+  return jsonify({
+    'success': True,
+    'genres': [{
+      'genre': row.genre,
+      'venues': row.venues,
+      'artists': row.artists
+    } for row in rows]
+  })
 
 @app.route('/artists/search', methods=['POST'])
 def search_artists():
@@ -469,62 +1502,123 @@ def search_artists():
   # seach for "A" should return "Guns N Petals", "Matt Quevado", and "The Wild Sax Band".
   # search for "band" should return "The Wild Sax Band".
 
-  query = request.form.get('search_term')
+  query = request.form.get('search_term', '')
+  page = request.form.get('page', 1, type=int)
+
+  app.logger.info('artist search', extra={'search_term': query, 'page': page})
+
+  response = _search_by_name(Artist, query, max(page, 1))
+
+  return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''))
 
-  print(query)
+@app.route('/artists/autocomplete')
+def autocomplete_artists():
+  # artist picker for the new show form
+  return _autocomplete(Artist, 'artist-names')
 
-  '''
-    https://knowledge.udacity.com/questions/83562
-  '''
+@app.route('/artists/available')
+def available_artists():
+  # artists, optionally in a genre, with no show overlapping [from, to)
 
-  results = Artist.query.filter(Artist.name.ilike('%{}%'.format(query))).all()
+  try:
+    start = dateutil.parser.parse(request.args['from'])
+    end = dateutil.parser.parse(request.args['to'])
+  except (KeyError, ValueError, OverflowError):
+    abort(400)
+
+  if end <= start:
+    abort(400)
+
+  genres = request.args.getlist('genre')
+  limit = min(max(request.args.get('limit', LISTING_PER_PAGE, type=int), 1), 1000)
+
+  # the start_time bound is implied by the overlap but lets the planner
+  # skip the partitions of later months
+  busy = db.session.query(Show.artist_id).filter(
+    Show.artist_id == Artist.id,
+    Show.start_time < end,
+    Show.time_range.op('&&')(db.func.tsrange(start, end, '[)'))
+  )
+
+  query = db.session.query(Artist.id, Artist.name, Artist.genres).filter(~busy.exists())
+
+  if genres:
+    query = query.filter(Artist.genres.contains(db.cast(genres, db.ARRAY(db.String))))
+
+  rows = query.order_by(Artist.id).limit(limit).all()
+
+  return jsonify({
+    'success': True,
+    'from': start.isoformat(),
+    'to': end.isoformat(),
+    'artists': [{
+      'id': row.id,
+      'name': row.name,
+      'genres': row.genres
+    } for row in rows]
+  })
+
+@prerendered.renderer('artist', '/artists/{}')
+def _render_artist_page(artist_id):
 
-  artist_list = []
+  """
+    Helper function for show_artist() and the prerendered artist pages
+  """
 
-  for result in results:
+  data = Artist._get_detail(artist_id)
 
-    temp_dict = {}
-    temp_dict['id'] = result.id
-    temp_dict['name'] = result.name
-    temp_dict['num_upcoming_shows'] = Show.query.filter_by(artist_id = result.id).filter(Show.start_time >= datetime.datetime.now()).all()
+  if data is None:
+    return None
 
-    artist_list.append(temp_dict)
+  data.update(_get_related('artist', artist_id))
 
-  response = {
-    'count': len(results),
-    'data': artist_list
-  }
-  return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''))
+  return render_template('pages/show_artist.html', artist=data)
 
 @app.route('/artists/<int:artist_id>')
+@prerendered.serves('artist', 'artist_id')
 def show_artist(artist_id):
   # shows the artist page with the given venue_id
   # TODO: replace with real artist data from the artist table, using artist_id
 
 
-  current_artist = Artist.query.get(artist_id)
+  page = _render_artist_page(artist_id)
 
-  past_shows = Show.query.filter_by(artist_id = artist_id).filter(Show.start_time < datetime.datetime.now()).all()
-  upcoming_shows = Show.query.filter_by(artist_id = artist_id).filter(Show.start_time >= datetime.datetime.now()).all()
+  if page is None:
+    abort(404)
 
-  past_shows_data = []
-  upcoming_shows_data = []
+  return page
 
-  for show in past_shows:
+@app.route('/artists/<int:artist_id>/delete', methods=['GET'])
+def delete_artist(artist_id):
 
-    past_shows_data.append(show._create_individual_show_dict_2())
+  try:
+    deleted, venue_ids, referrers = _delete_entities(Artist, [artist_id])
+    db.session.commit()
 
-  for show in upcoming_shows:
-    upcoming_shows_data.append(show._create_individual_show_dict_2())
+    if deleted:
+      response_cache.invalidate('genres', 'artists', 'artist-names', 'shows',
+        *['venue:' + str(i) for i in venue_ids] + ['venue:' + str(i) for kind, i in referrers if kind == 'venue'])
+      _prerender_pages(venue_ids=venue_ids, artist_ids=[artist_id], related=referrers)
+      flash('Artist ' + str(artist_id) + ' was deleted!')
+    else:
+      flash('Artist ' + str(artist_id) + ' could not be deleted!')
 
-  data = current_artist._create_individual_artist_dict_2()
+  except:
 
-  data['past_shows'] = past_shows_data
-  data['upcoming_shows'] =  upcoming_shows_data
-  data['past_shows_count'] = len(past_shows_data)
-  data['upcoming_shows_count'] = len(upcoming_shows_data)
+    db.session.rollback()
 
-  return render_template('pages/show_artist.html', artist=data)
+    flash('Artist ' + str(artist_id) + ' could not be deleted!')
+
+  finally:
+
+    db.session.close()
+
+  return redirect(url_for('index'))
+
+@app.route('/artists/delete', methods=['POST'])
+def delete_artists():
+  # deletes many artists at once, together with their shows
+  return _bulk_delete(Artist)
 
 #  Update
 #  ----------------------------------------------------------------
@@ -545,6 +1639,7 @@ def edit_artist(artist_id):
   form.image_link.data = artist.image_link
   form.seeking_venue.data = artist.seeking_venue
   form.seeking_description.data = artist.seeking_description
+  form.version.data = artist.version
   # TODO: populate form with fields from artist with ID <artist_id>
   return render_template('forms/edit_artist.html', form=form, artist=artist_data)
 
@@ -565,19 +1660,49 @@ def edit_artist_submission(artist_id):
       else:
         seeking_description = form.seeking_description.data
 
-      current_artist.name = form.name.data
-      current_artist.city = form.city.data
-      current_artist.state = form.state.data
-      current_artist.phone = form.phone.data
-      current_artist.genres = form.genres.data
-      current_artist.facebook_link = form.facebook_link.data
-      current_artist.website = form.website.data
-      current_artist.image_link = form.image_link.data
-      current_artist.seeking_venue = form.seeking_venue.data
-      current_artist.seeking_description = seeking_description
+      changed = _update_changed_columns(Artist, current_artist, {
+        'name': form.name.data,
+        'city': form.city.data,
+        'state': form.state.data,
+        'phone': form.phone.data,
+        'genres': form.genres.data,
+        'facebook_link': form.facebook_link.data,
+        'website': form.website.data,
+        'image_link': form.image_link.data,
+        'seeking_venue': form.seeking_venue.data,
+        'seeking_description': seeking_description
+      }, form.version.data)
+
+      if changed is None:
+        db.session.rollback()
+        flash('Artist ' + request.form['name'] + ' was edited by someone else in the meantime. Please review and try again.')
+        return redirect(url_for('edit_artist', artist_id=artist_id))
+
+      # only the artist's name and image are shown on the show listing and
+      # venue pages, and in the related sections of other pages
+      venue_ids = []
+      referrers = []
+
+      if {'name', 'image_link'} & set(changed):
+        venue_ids = [venue_id for venue_id, in db.session.query(Show.venue_id).filter(
+          Show.artist_id == artist_id).distinct()]
+        referrers = _related_referrers('artist', [artist_id])
 
       db.session.commit()
 
+      if changed:
+        response_cache.invalidate('genres', 'artists', 'artist-names')
+
+      if venue_ids or referrers:
+        response_cache.invalidate('shows', *['venue:' + str(venue_id) for venue_id in venue_ids] +
+          ['venue:' + str(i) for kind, i in referrers if kind == 'venue'])
+
+      if {'genres', 'city', 'state'} & set(changed):
+        _refresh_related('artist', artist_id)
+
+      if changed:
+        _prerender_pages(venue_ids=venue_ids, artist_ids=[artist_id], related=referrers)
+
       flash('Information for Artist ' + request.form['name'] + ' was successfully edited!')
 
   except:
@@ -611,6 +1736,7 @@ def edit_venue(venue_id):
   form.image_link.data = venue.image_link
   form.seeking_talent.data = venue.seeking_talent
   form.seeking_description.data = venue.seeking_description
+  form.version.data = venue.version
 
   # TODO: populate form with values from venue with ID <venue_id>
   return render_template('forms/edit_venue.html', form=form, venue=venue_data)
@@ -631,20 +1757,55 @@ def edit_venue_submission(venue_id):
       else:
         seeking_description = form.seeking_description.data
 
-      current_venue.name = form.name.data
-      current_venue.city = form.city.data
-      current_venue.state = form.state.data
-      current_venue.address = form.address.data
-      current_venue.phone = form.phone.data
-      current_venue.genres = form.genres.data
-      current_venue.facebook_link = form.facebook_link.data
-      current_venue.website = form.website.data
-      current_venue.image_link = form.image_link.data
-      current_venue.seeking_talent = form.seeking_talent.data
-      current_venue.seeking_description = seeking_description
+      # a moved venue is geocoded again by the next geocode-venues run
+      location = {}
+
+      if (form.address.data, form.city.data, form.state.data) != (
+        current_venue.address, current_venue.city, current_venue.state):
+        location = {'latitude': None, 'longitude': None, 'grid_cell': None}
+
+      changed = _update_changed_columns(Venue, current_venue, {
+        'name': form.name.data,
+        'city': form.city.data,
+        'state': form.state.data,
+        'address': form.address.data,
+        'phone': form.phone.data,
+        'genres': form.genres.data,
+        'facebook_link': form.facebook_link.data,
+        'website': form.website.data,
+        'image_link': form.image_link.data,
+        'seeking_talent': form.seeking_talent.data,
+        'seeking_description': seeking_description,
+        **location
+      }, form.version.data)
+
+      if changed is None:
+        db.session.rollback()
+        flash('Venue ' + request.form['name'] + ' was edited by someone else in the meantime. Please review and try again.')
+        return redirect(url_for('edit_venue', venue_id=venue_id))
+
+      # only the venue's name and image are shown on the artist pages, and
+      # in the related sections of other pages
+      artist_ids = []
+      referrers = []
+
+      if {'name', 'image_link'} & set(changed):
+        referrers = _related_referrers('venue', [venue_id])
+
+        if prerendered.enabled:
+          artist_ids = [artist_id for artist_id, in db.session.query(Show.artist_id).filter(
+            Show.venue_id == venue_id).distinct()]
 
       db.session.commit()
 
+      if {'genres', 'city', 'state'} & set(changed):
+        _refresh_related('venue', venue_id)
+
+      if changed:
+        response_cache.invalidate('genres', 'venues', 'venue-names', 'venue:' + str(venue_id), 'shows',
+          *['venue:' + str(i) for kind, i in referrers if kind == 'venue'])
+        _prerender_pages(venue_ids=[venue_id], artist_ids=artist_ids, related=referrers)
+
       flash('Information for Venue ' + request.form['name'] + ' was successfully edited!')
 
   except:
@@ -701,6 +1862,10 @@ def create_artist_submission():
       db.session.add(new_artist)
       db.session.commit()
 
+      response_cache.invalidate('genres', 'artists', 'artist-names')
+      _refresh_related('artist', new_artist.id)
+      _prerender_pages(artist_ids=[new_artist.id])
+
       flash('Artist ' + request.form['name'] + ' was successfully listed!')
 
   except:
@@ -724,20 +1889,84 @@ def create_artist_submission():
 #  ----------------------------------------------------------------
 
 @app.route('/shows')
+@response_cache.cached('shows')
 def shows():
   # displays list of shows at /shows
   # TODO: replace with real venues data.
   #       num_shows should be aggregated based on number of upcoming shows per venue.
 
-  data = []
+  after = _decode_cursor(request.args.get('after'))
+  before = _decode_cursor(request.args.get('before'))
+
+  # cursor values are [start_time, venue_id, artist_id]
+  for cursor in (after, before):
+    if cursor is not None:
+      if len(cursor) != 3 or [type(value) for value in cursor[1:]] != [int, int]:
+        abort(400)
+
+      try:
+        cursor[0] = datetime.datetime.fromisoformat(cursor[0])
+      except (TypeError, ValueError):
+        abort(400)
 
-  all_shows = Show.query.all()
+  filters, criteria = _show_filters()
 
-  for show in all_shows: 
+  page = _keyset_page(
+    _show_listing_query(criteria),
+    [Show.start_time, Show.venue_id, Show.artist_id],
+    reads.ShowRow,
+    lambda row: [row.start_time, row.venue_id, row.artist_id],
+    after=after,
+    before=before
+  )
 
-    data.append(show._create_individual_show_dict())
+  return render_template('pages/shows.html', shows=page['rows'], filters=filters,
+    previous_cursor=page['previous_cursor'], next_cursor=page['next_cursor'])
 
-  return render_template('pages/shows.html', shows=data)
+@app.route('/shows.ndjson')
+def export_shows():
+  # streams every show matching the /shows filters as one JSON object per line
+
+  filters, criteria = _show_filters()
+
+  rows = db.session.connection(execution_options={'stream_results': True}).execute(
+    _show_listing_query(criteria).order_by(Show.start_time, Show.venue_id, Show.artist_id))
+
+  def generate():
+    for row in rows:
+      yield json.dumps({
+        'venue_id': row.venue_id,
+        'venue_name': row.venue_name,
+        'artist_id': row.artist_id,
+        'artist_name': row.artist_name,
+        'artist_image_link': row.artist_image_link,
+        'start_time': row.start_time.isoformat()
+      }) + '\n'
+
+  return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@app.route('/export/<any(venues, artists, shows):kind>.<any(csv, ndjson):fmt>')
+def export_table(kind, fmt):
+  # streams a whole table as CSV or NDJSON, gzipped with ?gzip=1
+
+  gzip = request.args.get('gzip', type=int) == 1
+  table = {'venues': Venue, 'artists': Artist, 'shows': Show}[kind].__table__
+  export = exporter.Export(db.engine, table, fmt, gzip=gzip)
+
+  def generate():
+    for block in export:
+      yield block
+
+    app.logger.info('export finished', extra={
+      'table': kind,
+      'rows': export.rows,
+      'rows_per_second': round(export.rows_per_second)
+    })
+
+  filename = '{}.{}{}'.format(kind, fmt, '.gz' if gzip else '')
+
+  return Response(generate(), mimetype='application/gzip' if gzip else exporter.FORMATS[fmt],
+    headers={'Content-Disposition': 'attachment; filename=' + filename})
 
 @app.route('/shows/create')
 def create_shows():
@@ -761,14 +1990,27 @@ def create_show_submission():
       new_show = Show(
         venue_id = form.venue_id.data,
         artist_id = form.artist_id.data,
-        start_time = form.start_time.data
+        start_time = form.start_time.data,
+        time_range = Show._time_range(form.start_time.data, form.duration.data)
       )
 
       db.session.add(new_show)
 
       db.session.commit()
+
+      response_cache.invalidate('venues', 'venue:' + str(form.venue_id.data), 'shows')
+      _prerender_pages(venue_ids=[form.venue_id.data], artist_ids=[form.artist_id.data])
       flash('Show was successfully listed!')
 
+  except exc.IntegrityError as e:
+    db.session.rollback()
+
+    # 23P01 is exclusion_violation, raised by same_artist_overlapping_time
+    if getattr(e.orig, 'pgcode', None) == '23P01':
+      flash('Show could not be listed! The artist is already booked during that time.')
+    else:
+      flash('Show could not be listed!')
+
   except:
 # TODO: on unsuccessful db insert, flash an error instead.
 # e.g., flash('An error occurred. Venue ' + data.name + ' could not be listed.')
@@ -785,6 +2027,38 @@ def create_show_submission():
 
 
 
+@app.route('/changes')
+def changes():
+  # venues, artists and shows created, modified or deleted after the since
+  # cursor, for clients that sync incrementally instead of re-downloading
+
+  since = _decode_cursor(request.args.get('since'))
+  limit = min(max(request.args.get('limit', CHANGES_PER_PAGE, type=int), 1), CHANGES_PER_PAGE)
+
+  # cursor values are [changed_at, kind, key]
+  if since is not None:
+    if len(since) != 3 or [type(value) for value in since[1:]] != [str, str]:
+      abort(400)
+
+    try:
+      since[0] = datetime.datetime.fromisoformat(since[0])
+    except (TypeError, ValueError):
+      abort(400)
+
+  page = _get_changes(since, limit)
+
+  # without new changes, hand back the cursor the client sent
+  if page['cursor'] is None:
+    page['cursor'] = request.args.get('since')
+
+  return jsonify(dict(page, success=True))
+
+@app.route('/cache/stats')
+def cache_stats():
+  # hit/miss counters of the rendered page and autocomplete caches, for
+  # tuning their sizes and TTLs
+  return jsonify(dict(response_cache.stats(), autocomplete=prefix_cache.stats()))
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
@@ -794,15 +2068,543 @@ def server_error(error):
     return render_template('errors/500.html'), 500
 
 
-if not app.debug:
-    file_handler = FileHandler('error.log')
-    file_handler.setFormatter(
-        Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
+init_logging(app)
+SQLProfiler(app)
+
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+def _rollover_shows():
+
+  """
+    Helper function for rollover_show_counters() and prerender_worker()
+
+    Moves shows whose start_time has passed from the upcoming to the past
+    counters of their venues and artists, re-renders the prerendered pages
+    of those venues and artists and returns the (venue_id, artist_id) pairs
+    of the moved shows.
+  """
+
+  moved = db.session.execute(db.text('''
+    WITH moved AS (
+      UPDATE "Shows" SET is_past = true
+      WHERE NOT is_past AND start_time < :now
+      RETURNING venue_id, artist_id
+    ), venue_moves AS (
+      UPDATE "Venues" SET
+        upcoming_shows_count = upcoming_shows_count - m.n,
+        past_shows_count = past_shows_count + m.n,
+        updated_at = now()
+      FROM (SELECT venue_id, count(*) AS n FROM moved GROUP BY venue_id) m
+      WHERE "Venues".id = m.venue_id
+    ), artist_moves AS (
+      UPDATE "Artists" SET
+        upcoming_shows_count = upcoming_shows_count - m.n,
+        past_shows_count = past_shows_count + m.n,
+        updated_at = now()
+      FROM (SELECT artist_id, count(*) AS n FROM moved GROUP BY artist_id) m
+      WHERE "Artists".id = m.artist_id
     )
-    app.logger.setLevel(logging.INFO)
-    file_handler.setLevel(logging.INFO)
-    app.logger.addHandler(file_handler)
-    app.logger.info('errors')
+    SELECT venue_id, artist_id FROM moved
+  '''), {'now': datetime.datetime.now()}).fetchall()
+
+  db.session.commit()
+
+  _prerender_pages(
+    venue_ids=[venue_id for venue_id, _ in moved],
+    artist_ids=[artist_id for _, artist_id in moved])
+
+  return moved
+
+@app.cli.command('rollover-show-counters')
+def rollover_show_counters():
+  """
+    Moves shows whose start_time has passed from the upcoming to the past
+    counters of their venues and artists. Meant to be run periodically,
+    e.g. every minute from cron.
+  """
+
+  moved = _rollover_shows()
+
+  click.echo('{} shows moved from upcoming to past'.format(len(moved)))
+
+@app.cli.command('prerender-worker')
+@click.option('--interval', default=60, show_default=True, help='Seconds between rollovers.')
+def prerender_worker(interval):
+  """
+    Runs the show rollover in a loop and re-renders the prerendered venue
+    and artist pages whose shows moved from upcoming to past, for
+    deployments without cron. Stop it with Ctrl-C.
+  """
+
+  if not prerendered.enabled:
+    raise click.ClickException('Prerendering is off, set PRERENDER_PAGES first.')
+
+  while True:
+    moved = _rollover_shows()
+    db.session.remove()
+
+    if moved:
+      click.echo('{} shows moved from upcoming to past'.format(len(moved)))
+
+    time.sleep(interval)
+
+@app.cli.command('prerender-pages')
+@click.option('--kind', type=click.Choice(['venue', 'artist']), multiple=True,
+  help='Only render these pages. Defaults to both.')
+def prerender_pages(kind):
+  """
+    Renders every venue and artist page into the prerendered store, e.g.
+    after turning prerendering on or after a bulk import.
+  """
+
+  if not prerendered.enabled:
+    raise click.ClickException('Prerendering is off, set PRERENDER_PAGES first.')
+
+  for name, model in (('venue', Venue), ('artist', Artist)):
+    if kind and name not in kind:
+      continue
+
+    ids = [entity_id for entity_id, in db.session.query(model.id).order_by(model.id)]
+    prerendered.refresh(name, ids)
+    db.session.remove()
+
+    click.echo('{} {} pages rendered'.format(len(ids), name))
+
+@app.cli.command('create-show-partitions')
+@click.option('--months', default=12, show_default=True, help='Months to cover, starting with the current one.')
+def create_show_partitions(months):
+  """
+    Creates the missing monthly Shows partitions ahead of time. Meant to be
+    run periodically, e.g. monthly from cron, so that new shows never land
+    in the default partition.
+  """
+
+  created = partitions.create_partitions(db.session.connection(), datetime.datetime.now(), months)
+  db.session.commit()
+
+  for name in created:
+    click.echo('created ' + name)
+
+  click.echo('{} partitions created'.format(len(created)))
+
+@app.cli.command('archive-show-partitions')
+@click.option('--months', default=24, show_default=True, help='Months of past shows to keep attached.')
+@click.option('--drop', is_flag=True, help='Drop the detached partitions instead of moving them to the archive schema.')
+def archive_show_partitions(months, drop):
+  """
+    Detaches the Shows partitions of months older than the retention
+    window, moving them to the archive schema or dropping them, and
+    re-renders the pages that listed their shows.
+  """
+
+  if months < 1:
+    raise click.BadParameter('must be at least 1', param_hint='--months')
+
+  before = partitions.add_months(partitions.month_start(datetime.datetime.now()), -months)
+
+  archived, venue_ids, artist_ids = partitions.archive_partitions(db.session.connection(), before, drop=drop)
+  db.session.commit()
+
+  _prerender_pages(venue_ids=venue_ids, artist_ids=artist_ids)
+
+  for name in archived:
+    click.echo(('dropped ' if drop else 'archived ') + name)
+
+  click.echo('{} partitions {}'.format(len(archived), 'dropped' if drop else 'archived'))
+
+@app.cli.command('build-related')
+@click.option('--top-k', default=RELATED_PER_KIND, show_default=True,
+  help='Related venues and related artists kept per entity.')
+@click.option('--max-bucket', default=RELATED_MAX_BUCKET, show_default=True,
+  help='Members of an LSH bucket compared with each other.')
+@click.option('--batch-size', default=5000, show_default=True)
+def build_related(top_k, max_bucket, batch_size):
+  """
+    Rebuilds the LSH buckets and the related venues/artists of every venue
+    and artist from scratch, then re-renders every prerendered page. Create
+    and edit keep them up to date incrementally in between.
+  """
+
+  started = time.perf_counter()
+  entities = {}
+
+  for kind, model in (('venue', Venue), ('artist', Artist)):
+    for row in db.session.query(model.id, model.genres, model.city, model.state).yield_per(10000):
+      entities[(kind, row.id)] = related.features(row.genres, row.city, row.state)
+
+  bucket_rows, related_rows = related.build(entities, top_k, max_bucket)
+
+  db.session.execute('TRUNCATE "SimilarityBuckets", "RelatedEntities"')
+
+  for batch in importer.batched(bucket_rows, batch_size):
+    db.session.execute(SimilarityBucket.__table__.insert(), [
+      {'kind': kind, 'entity_id': entity_id, 'band_key': band_key}
+      for kind, entity_id, band_key in batch])
+
+  for batch in importer.batched(related_rows, batch_size):
+    db.session.execute(RelatedEntity.__table__.insert(), [
+      {'kind': kind, 'entity_id': entity_id, 'related_kind': related_kind,
+        'related_id': related_id, 'score': score}
+      for kind, entity_id, related_kind, related_id, score in batch])
+
+  db.session.commit()
+
+  click.echo('{} entities, {} related rows in {:.1f}s'.format(
+    len(entities), len(related_rows), time.perf_counter() - started))
+
+  if prerendered.enabled:
+    _prerender_pages(
+      venue_ids=[entity_id for kind, entity_id in entities if kind == 'venue'],
+      artist_ids=[entity_id for kind, entity_id in entities if kind == 'artist'])
+    click.echo('{} pages rendered'.format(len(entities)))
+
+@app.cli.command('geocode-venues')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False, allow_dash=True))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson']),
+  help='File format, detected from the extension when omitted.')
+@click.option('--all', 'regeocode', is_flag=True, help='Also geocode venues that already have coordinates.')
+@click.option('--batch-size', default=5000, show_default=True)
+def geocode_venues(path, fmt, regeocode, batch_size):
+  """
+    Fills in the coordinates and grid cell of venues from a local lookup
+    file with city, state, latitude, longitude and optional address
+    columns. Rows without an address give the coordinates of their city,
+    used for venues whose address is not listed.
+  """
+
+  try:
+    fmt = fmt or importer.detect_format(path)
+  except ValueError as e:
+    raise click.UsageError(str(e))
+
+  with click.open_file(path, encoding='utf-8') as stream:
+    lookup = geo.load_lookup(importer.read_records(stream, fmt))
+
+  query = db.session.query(Venue.id, Venue.address, Venue.city, Venue.state)
+
+  if not regeocode:
+    query = query.filter(Venue.latitude.is_(None))
+
+  venues = query.order_by(Venue.id).all()
+  table = Venue.__table__
+  geocoded = 0
+
+  for batch in importer.batched(venues, batch_size):
+    values = []
+
+    for venue in batch:
+      coordinates = geo.geocode(lookup, venue.address, venue.city, venue.state)
+
+      if coordinates is not None:
+        values.append({
+          'venue_id': venue.id,
+          'venue_latitude': coordinates[0],
+          'venue_longitude': coordinates[1],
+          'venue_grid_cell': geo.grid_cell(*coordinates)
+        })
+
+    if values:
+      db.session.execute(table.update().where(table.c.id == db.bindparam('venue_id')).values(
+        latitude=db.bindparam('venue_latitude'),
+        longitude=db.bindparam('venue_longitude'),
+        grid_cell=db.bindparam('venue_grid_cell')
+      ), values)
+      db.session.commit()
+      geocoded += len(values)
+
+  click.echo('{} of {} venues geocoded'.format(geocoded, len(venues)))
+
+@app.cli.command('prune-tombstones')
+@click.option('--days', default=30, show_default=True,
+  help='Keep tombstones of deletions younger than this many days.')
+def prune_tombstones(days):
+  """
+    Removes old deletion records from the change feed. Clients whose cursor
+    is older than the retention window have to resync from scratch.
+  """
+
+  pruned = db.session.query(Tombstone).filter(
+    Tombstone.deleted_at < datetime.datetime.now() - datetime.timedelta(days=days)
+  ).delete(synchronize_session=False)
+  db.session.commit()
+
+  click.echo('{} tombstones pruned'.format(pruned))
+
+@app.cli.command('check-show-counters')
+@click.option('--fix', is_flag=True, help='Overwrite mismatched counters with the recounted values.')
+def check_show_counters(fix):
+  """
+    Recounts shows per venue and artist and reports every row whose stored
+    counters disagree with the Shows table. With --fix the pages of the
+    fixed rows are re-rendered as well.
+  """
+
+  mismatches = 0
+  fixed = {Venue: [], Artist: []}
+
+  for model, show_key in ((Venue, Show.venue_id), (Artist, Show.artist_id)):
+
+    upcoming = db.func.count(Show.start_time).filter(Show.is_past.is_(False))
+    past = db.func.count(Show.start_time).filter(Show.is_past.is_(True))
+
+    rows = db.session.query(
+      model.id,
+      model.upcoming_shows_count,
+      model.past_shows_count,
+      upcoming.label('upcoming'),
+      past.label('past')
+    ).outerjoin(Show, show_key == model.id
+    ).group_by(model.id
+    ).having(db.or_(model.upcoming_shows_count != upcoming, model.past_shows_count != past)
+    ).all()
+
+    for row in rows:
+      click.echo('{} {}: stored {}/{} upcoming/past, counted {}/{}'.format(
+        model.__name__, row.id, row.upcoming_shows_count, row.past_shows_count, row.upcoming, row.past))
+
+      if fix:
+        db.session.query(model).filter(model.id == row.id).update({
+          'upcoming_shows_count': row.upcoming,
+          'past_shows_count': row.past
+        }, synchronize_session=False)
+        fixed[model].append(row.id)
+
+    mismatches += len(rows)
+
+  if fix:
+    db.session.commit()
+    _prerender_pages(venue_ids=fixed[Venue], artist_ids=fixed[Artist])
+
+  click.echo('{} mismatched rows{}'.format(mismatches, ', fixed' if fix and mismatches else ''))
+
+  if mismatches and not fix:
+    raise SystemExit(1)
+
+@app.cli.command('import-data')
+@click.argument('kind', type=click.Choice(['venues', 'artists', 'shows']))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False, allow_dash=True))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson']),
+  help='File format, detected from the extension when omitted.')
+@click.option('--batch-size', default=5000, show_default=True,
+  help='Rows per INSERT statement and transaction.')
+@click.option('--on-conflict', type=click.Choice(['skip', 'update']), default='skip', show_default=True,
+  help='What to do with venues/artists that already exist. Conflicting shows are always skipped.')
+def import_data(kind, path, fmt, batch_size, on_conflict):
+  """
+    Streams venues, artists or shows from a CSV or NDJSON file into the
+    database in batched multi-row inserts. Records with bad values and shows
+    of unknown venues or artists are reported and skipped.
+  """
+
+  try:
+    fmt = fmt or importer.detect_format(path)
+  except ValueError as e:
+    raise click.UsageError(str(e))
+
+  tables = {
+    'venues': Venue.__table__,
+    'artists': Artist.__table__,
+    'shows': Show.__table__
+  }
+
+  rejects = []
+
+  def progress(read, written, elapsed):
+    click.echo('{} read, {} written, {:.0f} rows/sec'.format(read, written, read / max(elapsed, 1e-6)), err=True)
+
+  def rejected(number, reason):
+    rejects.append(number)
+    click.echo('{}: record {}: {}'.format(path, number, reason), err=True)
+
+  with click.open_file(path, encoding='utf-8', newline='') as stream:
+    read, written, elapsed = importer.import_records(
+      db.engine, tables, kind, importer.read_records(stream, fmt),
+      batch_size=batch_size, on_conflict=on_conflict, progress=progress,
+      default_duration=app.config['SHOW_DEFAULT_DURATION_MINUTES'], rejected=rejected)
+
+  click.echo('Imported {} of {} {} in {:.1f}s ({:.0f} rows/sec), {} rejected'.format(
+    written, read, kind, elapsed, read / max(elapsed, 1e-6), len(rejects)))
+
+@app.cli.command('export-data')
+@click.argument('kind', type=click.Choice(['venues', 'artists', 'shows']))
+@click.argument('path', type=click.Path(dir_okay=False, writable=True, allow_dash=True))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson']), default='ndjson', show_default=True)
+@click.option('--gzip', is_flag=True, help='Compress the output.')
+@click.option('--chunk-size', default=5000, show_default=True, help='Rows fetched from the server-side cursor at a time.')
+def export_data(kind, path, fmt, gzip, chunk_size):
+  """
+    Streams a whole table to a file (or - for stdout) in constant memory.
+  """
+
+  table = {'venues': Venue, 'artists': Artist, 'shows': Show}[kind].__table__
+  export = exporter.Export(db.engine, table, fmt, gzip=gzip, chunk_size=chunk_size)
+
+  with click.open_file(path, 'wb') as f:
+    for block in export:
+      f.write(block)
+
+  click.echo('Exported {} {} in {:.1f}s ({:.0f} rows/sec)'.format(
+    export.rows, kind, export.elapsed, export.rows_per_second), err=True)
+
+@app.cli.command('seed-data')
+@click.option('--venues', default=100000, show_default=True)
+@click.option('--artists', default=100000, show_default=True)
+@click.option('--shows', default=5000000, show_default=True)
+@click.option('--seed', default=0, show_default=True, help='Same seed, sizes and epoch give the same rows.')
+@click.option('--epoch', type=click.DateTime(),
+  help='Middle of the generated show schedule. Defaults to the start of today.')
+@click.option('--batch-size', default=5000, show_default=True)
+def seed_data(venues, artists, shows, seed, epoch, batch_size):
+  """
+    Fills the database with a deterministic synthetic dataset for
+    benchmarking.
+  """
+
+  tables = {
+    'venues': Venue.__table__,
+    'artists': Artist.__table__,
+    'shows': Show.__table__
+  }
+
+  def progress(read, written, elapsed):
+    click.echo('{} rows, {:.0f} rows/sec'.format(read, read / max(elapsed, 1e-6)), err=True)
+
+  try:
+    results = benchmark.seed_database(db.engine, tables, venues, artists, shows,
+      seed=seed, epoch=epoch, batch_size=batch_size, progress=progress,
+      default_duration=app.config['SHOW_DEFAULT_DURATION_MINUTES'])
+  except ValueError as e:
+    raise click.UsageError(str(e))
+
+  for kind, (read, written, elapsed) in results.items():
+    click.echo('{}: {} generated, {} written in {:.1f}s'.format(kind, read, written, elapsed))
+
+  db.session.execute('ANALYZE')
+  db.session.commit()
+
+@app.cli.command('benchmark-datetime')
+@click.option('--rows', default=10000, show_default=True)
+@click.option('--format', 'fmt', type=click.Choice(sorted(DATETIME_FORMATS)), default='full', show_default=True)
+def benchmark_datetime(rows, fmt):
+  """
+    Compares the per-row cost of formatting show start times the old way
+    (strftime in the view, dateutil parse and a Babel pattern parse in the
+    filter) against the datetime filter on datetime objects.
+  """
+
+  start = datetime.datetime(2026, 1, 1, 20, 0)
+  values = [start + datetime.timedelta(minutes=37 * i) for i in range(rows)]
+  pattern = DATETIME_FORMATS[fmt]
+
+  results = benchmark.time_per_row([
+    ('string', lambda value: babel.dates.format_datetime(
+      dateutil.parser.parse(value.strftime("%Y-%m-%d %H:%M:%S")), pattern, locale='en')),
+    ('datetime', lambda value: format_datetime(value, fmt))
+  ], values)
+
+  for name, micros in results.items():
+    click.echo('{:<10} {:>9.2f} us/row'.format(name, micros))
+
+  click.echo('speedup    {:>9.1f}x'.format(results['string'] / results['datetime']))
+
+@app.cli.command('benchmark-reads')
+@click.option('--rows', default=100000, show_default=True, help='Rows read from each table.')
+@click.option('--repeat', default=5, show_default=True)
+def benchmark_reads(rows, repeat):
+  """
+    Compares loading the artist and venue listings as full ORM entities,
+    as ORM column queries and as reads row objects through Core, reporting
+    latency and peak memory of each.
+  """
+
+  def reset():
+    db.session.rollback()
+    db.session.expunge_all()
+
+  for name, model, row_class, columns, to_dict in (
+    ('artists', Artist, reads.ArtistRow, [Artist.id, Artist.name],
+      Artist._create_individual_artist_dict),
+    ('venues', Venue, reads.VenueRow,
+      [Venue.id, Venue.name, Venue.city, Venue.state, Venue.upcoming_shows_count],
+      Venue._create_individual_venue_dict)
+  ):
+    results = benchmark.measure_reads([
+      ('orm', lambda: [to_dict(entity) for entity in
+        db.session.query(model).order_by(model.id).limit(rows)]),
+      ('columns', lambda: [row._asdict() for row in
+        db.session.query(*columns).order_by(model.id).limit(rows)]),
+      ('reads', lambda: reads.fetch(db.session.connection(),
+        db.select(columns).order_by(model.id).limit(rows), row_class))
+    ], reset, repeat=repeat)
+
+    for implementation, result in results.items():
+      click.echo('{:<8} {:<8} {rows:>7} rows {ms:>10.2f} ms {peak_memory_kb:>10.1f} KB'.format(
+        name, implementation, **result))
+
+@app.cli.command('benchmark')
+@click.option('--iterations', default=20, show_default=True)
+@click.option('--output', type=click.Path(dir_okay=False), help='Write the results as a JSON baseline.')
+@click.option('--baseline', type=click.Path(exists=True, dir_okay=False), help='Compare against this baseline.')
+@click.option('--tolerance', default=0.2, show_default=True, help='Allowed p95/memory growth, as a fraction.')
+@click.option('--cache/--no-cache', default=False, show_default=True, help='Leave the page cache on.')
+def run_benchmark(iterations, output, baseline, tolerance, cache):
+  """
+    Measures latency percentiles, SQL statements and peak memory of the
+    main routes through the test client and optionally checks them against
+    a stored baseline, exiting with status 1 on a regression.
+  """
+
+  venue_id = db.session.query(db.func.min(Venue.id)).scalar()
+  artist_id = db.session.query(db.func.min(Artist.id)).scalar()
+  db.session.remove()
+
+  if venue_id is None or artist_id is None:
+    raise click.ClickException('No data to benchmark, run flask seed-data first.')
+
+  routes = [
+    ('venues', 'GET', '/venues', None),
+    ('show_venue', 'GET', '/venues/{}'.format(venue_id), None),
+    ('show_artist', 'GET', '/artists/{}'.format(artist_id), None),
+    ('artists', 'GET', '/artists', None),
+    ('search_artists', 'POST', '/artists/search', {'search_term': 'band'}),
+    ('shows', 'GET', '/shows', None)
+  ]
+
+  csrf_enabled = app.config.get('WTF_CSRF_ENABLED', True)
+  cache_entries = response_cache.max_entries
+  app.config['WTF_CSRF_ENABLED'] = False
+
+  if not cache:
+    response_cache.max_entries = 0
+
+  try:
+    results = benchmark.run_benchmarks(app, db.engine, routes, iterations=iterations)
+  finally:
+    app.config['WTF_CSRF_ENABLED'] = csrf_enabled
+    response_cache.max_entries = cache_entries
+
+  for name, result in results.items():
+    click.echo('{:<16} p50 {p50_ms:>9.2f} ms  p95 {p95_ms:>9.2f} ms  p99 {p99_ms:>9.2f} ms  '
+      '{queries:>4} queries  {peak_memory_kb:>10.1f} KB'.format(name, **result))
+
+  if output:
+    benchmark.save_baseline(output, results, {
+      'iterations': iterations,
+      'venues': db.session.query(db.func.count(Venue.id)).scalar(),
+      'artists': db.session.query(db.func.count(Artist.id)).scalar(),
+      'shows': db.session.query(db.func.count(Show.venue_id)).scalar()
+    })
+
+  if baseline:
+    regressions = benchmark.compare(benchmark.load_baseline(baseline), results, tolerance)
+
+    for regression in regressions:
+      click.echo('REGRESSION ' + regression, err=True)
+
+    if regressions:
+      raise SystemExit(1)
 
 #----------------------------------------------------------------------------#
 # Launch.
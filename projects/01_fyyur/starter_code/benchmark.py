@@ -0,0 +1,305 @@
+import datetime
+import json
+import math
+import random
+import time
+import tracemalloc
+
+from sqlalchemy import event
+
+import importer
+
+GENRES = ('Alternative', 'Blues', 'Classical', 'Country', 'Electronic', 'Folk', 'Funk',
+          'Hip-Hop', 'Heavy Metal', 'Instrumental', 'Jazz', 'Musical Theatre', 'Pop',
+          'Punk', 'R&B', 'Reggae', 'Rock n Roll', 'Soul', 'Other')
+STATES = ('CA', 'NY', 'TX', 'WA', 'IL', 'FL', 'MA', 'CO', 'GA', 'OR')
+WORDS = ('Blue', 'Red', 'Golden', 'Velvet', 'Electric', 'Silent', 'Wild', 'Lucky', 'Broken',
+         'Midnight', 'Crystal', 'Iron', 'Paper', 'Neon', 'Lonely', 'Happy', 'Rolling', 'Hollow')
+NOUNS = ('Hop', 'Lounge', 'Room', 'Hall', 'Garden', 'Stage', 'Club', 'Barn', 'Cellar',
+         'Petals', 'Band', 'Sax', 'Riders', 'Owls', 'Kings', 'Echoes', 'Wolves', 'Strings')
+
+# shows are generated from this many days ago to as many days ahead
+SHOW_DAYS = 365
+
+
+def _name(rng, i):
+    return 'The {} {} {}'.format(rng.choice(WORDS), rng.choice(NOUNS), i)
+
+
+def _genres(rng):
+    return rng.sample(GENRES, rng.randint(1, 3))
+
+
+def generate_venues(count, seed):
+    rng = random.Random('venues-{}'.format(seed))
+
+    for i in range(count):
+        yield {
+            'name': _name(rng, i),
+            'city': 'City {}'.format(rng.randrange(max(count // 50, 1))),
+            'state': rng.choice(STATES),
+            'address': '{} Main Street'.format(i),
+            'phone': '555-{:03d}-{:04d}'.format(rng.randrange(1000), rng.randrange(10000)),
+            'website': 'https://venue{}.example.com'.format(i),
+            'image_link': 'https://images.example.com/venues/{}.jpg'.format(i),
+            'facebook_link': 'https://www.facebook.com/venue{}'.format(i),
+            'seeking_talent': rng.random() < 0.3,
+            'seeking_description': 'Looking for local talent',
+            'genres': _genres(rng)
+        }
+
+
+def generate_artists(count, seed):
+    rng = random.Random('artists-{}'.format(seed))
+
+    for i in range(count):
+        yield {
+            'name': _name(rng, i),
+            'city': 'City {}'.format(rng.randrange(max(count // 50, 1))),
+            'state': rng.choice(STATES),
+            'phone': '555-{:03d}-{:04d}'.format(rng.randrange(1000), rng.randrange(10000)),
+            'website': 'https://artist{}.example.com'.format(i),
+            'image_link': 'https://images.example.com/artists/{}.jpg'.format(i),
+            'facebook_link': 'https://www.facebook.com/artist{}'.format(i),
+            'seeking_venue': rng.random() < 0.3,
+            'seeking_description': 'Looking for shows',
+            'genres': _genres(rng)
+        }
+
+
+def _show_step(count, days):
+    return datetime.timedelta(days=2 * days) / max(count, 1)
+
+
+def generate_shows(count, venue_ids, artist_ids, seed, epoch, days=SHOW_DAYS):
+    """
+      Spreads count shows evenly from days before epoch to days after it.
+      Every show gets a distinct start_time, so no two shows can
+      collide on same_artist_start_time. The artists take turns in a fixed
+      shuffled order, so the shows of an artist are len(artist_ids) steps
+      apart and do not overlap as long as that gap exceeds their duration;
+      seed_database() checks it.
+    """
+
+    rng = random.Random('shows-{}'.format(seed))
+    start = epoch - datetime.timedelta(days=days)
+    step = _show_step(count, days)
+
+    artist_order = list(artist_ids)
+    rng.shuffle(artist_order)
+
+    for i in range(count):
+        yield {
+            'venue_id': rng.choice(venue_ids),
+            'artist_id': artist_order[i % len(artist_order)],
+            'start_time': start + step * i
+        }
+
+
+def seed_database(engine, tables, venues, artists, shows, seed=0, epoch=None, batch_size=5000,
+                  progress=None, default_duration=120):
+    """
+      Loads a deterministic synthetic dataset through the bulk importer.
+      The shows are centred on epoch, by default the start of today. The
+      same sizes, seed and epoch always produce the same rows; which shows
+      count as past still depends on when they are loaded. Raises
+      ValueError if there are too few artists for their shows not to
+      overlap, as overlapping shows would be skipped on import.
+    """
+
+    if shows and artists and _show_step(shows, SHOW_DAYS) * artists < datetime.timedelta(minutes=default_duration):
+        raise ValueError('{} shows of {} minutes overlap with only {} artists'.format(
+            shows, default_duration, artists))
+
+    if epoch is None:
+        epoch = datetime.datetime.combine(datetime.date.today(), datetime.time())
+
+    results = {}
+
+    for kind, records in (('venues', generate_venues(venues, seed)),
+                          ('artists', generate_artists(artists, seed))):
+        results[kind] = importer.import_records(
+            engine, tables, kind, records, batch_size=batch_size, progress=progress)
+
+    with engine.connect() as connection:
+        venue_ids = [row[0] for row in connection.execute(
+            tables['venues'].select().with_only_columns([tables['venues'].c.id]))]
+        artist_ids = [row[0] for row in connection.execute(
+            tables['artists'].select().with_only_columns([tables['artists'].c.id]))]
+
+    if shows and venue_ids and artist_ids:
+        results['shows'] = importer.import_records(
+            engine, tables, 'shows', generate_shows(shows, sorted(venue_ids), sorted(artist_ids), seed, epoch),
+            batch_size=batch_size, progress=progress, default_duration=default_duration)
+
+    return results
+
+
+def _percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[max(int(math.ceil(fraction * len(ordered))) - 1, 0)]
+
+
+def run_benchmarks(app, engine, routes, iterations=20, warmup=2):
+    """
+      Requests every (name, method, path, form data) route through the Flask
+      test client and returns latency percentiles in milliseconds, SQL
+      statements per request and peak Python memory per request. tracemalloc
+      slows allocation down several times over, so latencies come from
+      untraced requests and the peak memory from one more, traced request.
+    """
+
+    client = app.test_client()
+    results = {}
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(1)
+
+    event.listen(engine, 'before_cursor_execute', count)
+
+    try:
+        for name, method, path, data in routes:
+            for _ in range(warmup):
+                client.open(path, method=method, data=data)
+
+            latencies = []
+            queries = []
+
+            for _ in range(iterations):
+                del statements[:]
+                started = time.perf_counter()
+
+                response = client.open(path, method=method, data=data)
+
+                latencies.append((time.perf_counter() - started) * 1000)
+                queries.append(len(statements))
+
+                if response.status_code != 200:
+                    raise RuntimeError('{} {} returned {}'.format(method, path, response.status_code))
+
+            tracemalloc.start()
+
+            try:
+                client.open(path, method=method, data=data)
+                peak = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+
+            results[name] = {
+                'path': path,
+                'p50_ms': round(_percentile(latencies, 0.50), 3),
+                'p95_ms': round(_percentile(latencies, 0.95), 3),
+                'p99_ms': round(_percentile(latencies, 0.99), 3),
+                'queries': max(queries),
+                'peak_memory_kb': round(peak / 1024.0, 1)
+            }
+    finally:
+        event.remove(engine, 'before_cursor_execute', count)
+
+    return results
+
+
+def time_per_row(implementations, values, repeat=5):
+    """
+      Calls every (name, function) implementation on each of values and
+      returns the best of repeat runs in microseconds per value. The
+      implementations must agree on every value.
+    """
+
+    expected = None
+    results = {}
+
+    for name, function in implementations:
+        output = [function(value) for value in values]
+
+        if expected is None:
+            expected = output
+        elif output != expected:
+            raise RuntimeError('{} disagrees with {}'.format(name, implementations[0][0]))
+
+        best = None
+
+        for _ in range(repeat):
+            started = time.perf_counter()
+
+            for value in values:
+                function(value)
+
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+
+        results[name] = round(best / len(values) * 1e6, 3)
+
+    return results
+
+
+def measure_reads(implementations, reset, repeat=5):
+    """
+      Calls every (name, function) implementation repeat times, calling
+      reset after each run, and returns the best latency in milliseconds,
+      the peak Python memory of a traced run and the number of rows the
+      function returned.
+    """
+
+    results = {}
+
+    for name, function in implementations:
+        best = None
+
+        for _ in range(repeat):
+            started = time.perf_counter()
+            rows = function()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+            del rows
+            reset()
+
+        tracemalloc.start()
+        rows = len(function())
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        reset()
+
+        results[name] = {
+            'ms': round(best * 1000, 3),
+            'peak_memory_kb': round(peak / 1024.0, 1),
+            'rows': rows
+        }
+
+    return results
+
+
+def compare(baseline, current, tolerance=0.2):
+    """
+      Returns a message for every route whose p95 latency or peak memory
+      grew by more than tolerance, or whose query count grew at all,
+      relative to the baseline.
+    """
+
+    regressions = []
+
+    for name, result in sorted(current.items()):
+        previous = baseline.get(name)
+
+        if previous is None:
+            continue
+
+        for metric in ('p95_ms', 'peak_memory_kb'):
+            if result[metric] > previous[metric] * (1 + tolerance):
+                regressions.append('{}: {} {} -> {}'.format(name, metric, previous[metric], result[metric]))
+
+        if result['queries'] > previous['queries']:
+            regressions.append('{}: queries {} -> {}'.format(name, previous['queries'], result['queries']))
+
+    return regressions
+
+
+def load_baseline(path):
+    with open(path) as f:
+        return json.load(f)['routes']
+
+
+def save_baseline(path, results, meta):
+    with open(path, 'w') as f:
+        json.dump({'meta': meta, 'routes': results}, f, indent=2, sort_keys=True)
@@ -0,0 +1,227 @@
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import request, session, make_response
+from flask_wtf.csrf import generate_csrf
+
+# Rendered pages embed the per-session CSRF token in the search forms, so the
+# token is swapped for this marker before a page is stored and swapped back
+# for the current session's token when it is served.
+CSRF_PLACEHOLDER = b'\x00csrf-token\x00'
+
+
+class ResponseCache(object):
+    """
+      In-process LRU cache of rendered GET responses.
+
+      Entries expire after RESPONSE_CACHE_TTL seconds and at most
+      RESPONSE_CACHE_MAX_ENTRIES are kept. Each entry is tagged when it is
+      stored and write handlers drop every entry carrying a tag with
+      invalidate(). The cache is per process, so with several workers a
+      write only invalidates the worker that handled it and the TTL bounds
+      staleness everywhere else.
+    """
+
+    def __init__(self, app=None):
+        self._entries = OrderedDict()
+        self._tags = {}
+        self._lock = threading.Lock()
+        self._linked = []
+        self.max_entries = 512
+        self.ttl = 300
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.max_entries = app.config.get('RESPONSE_CACHE_MAX_ENTRIES', self.max_entries)
+        self.ttl = app.config.get('RESPONSE_CACHE_TTL', self.ttl)
+
+    def cached(self, *tags):
+        """
+          Decorator for GET views. tags may reference view arguments as
+          format fields, e.g. 'venue:{venue_id}'.
+        """
+
+        def decorator(view):
+
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+
+                # pending flash messages are rendered into the page once only
+                if self.max_entries <= 0 or '_flashes' in session:
+                    return view(*args, **kwargs)
+
+                key = request.full_path
+                entry = self._get(key)
+
+                if entry is not None:
+                    body, status, mimetype = entry
+                    response = make_response(
+                        body.replace(CSRF_PLACEHOLDER, generate_csrf().encode()), status)
+                    response.mimetype = mimetype
+                    return response
+
+                response = make_response(view(*args, **kwargs))
+
+                if response.status_code == 200 and not response.is_streamed:
+                    body = response.get_data().replace(generate_csrf().encode(), CSRF_PLACEHOLDER)
+                    self._set(key, (body, response.status_code, response.mimetype),
+                              [tag.format(**kwargs) for tag in tags])
+
+                return response
+
+            return wrapper
+
+        return decorator
+
+    def link(self, other):
+        """
+          Makes invalidate() pass its tags on to other, another cache with an
+          invalidate(*tags) method, so write handlers only name them once.
+        """
+
+        self._linked.append(other)
+
+    def invalidate(self, *tags):
+        with self._lock:
+            for tag in tags:
+                for key in self._tags.pop(tag, ()):
+                    if self._entries.pop(key, None) is not None:
+                        self.invalidations += 1
+
+        for other in self._linked:
+            other.invalidate(*tags)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': float(self.hits) / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations
+            }
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None or entry[0] < time.time():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def _set(self, key, value, tags):
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (time.time() + self.ttl, value, tags)
+
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+
+        if entry is not None:
+            for tag in entry[2]:
+                keys = self._tags.get(tag)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del self._tags[tag]
+
+
+class PrefixCache(object):
+    """
+      Small in-process LRU cache of autocomplete results, keyed on a tag
+      naming the table they come from and the normalised prefix.
+
+      Autocomplete sends one request per keystroke. Kept apart from
+      ResponseCache, that traffic cannot evict rendered pages, and "The"
+      and "the" share an entry. Entries expire after AUTOCOMPLETE_CACHE_TTL
+      seconds, at most AUTOCOMPLETE_CACHE_MAX_ENTRIES are kept, and
+      invalidate() drops every entry of a tag.
+    """
+
+    def __init__(self, app=None):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.max_entries = 256
+        self.ttl = 300
+        self.hits = 0
+        self.misses = 0
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.max_entries = app.config.get('AUTOCOMPLETE_CACHE_MAX_ENTRIES', self.max_entries)
+        self.ttl = app.config.get('AUTOCOMPLETE_CACHE_TTL', self.ttl)
+
+    def get(self, tag, key):
+        with self._lock:
+            entry = self._entries.get((tag, key))
+
+            if entry is None or entry[0] < time.time():
+                if entry is not None:
+                    del self._entries[(tag, key)]
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end((tag, key))
+            self.hits += 1
+            return entry[1]
+
+    def set(self, tag, key, value):
+        if self.max_entries <= 0:
+            return
+
+        with self._lock:
+            self._entries.pop((tag, key), None)
+            self._entries[(tag, key)] = (time.time() + self.ttl, value)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, *tags):
+        with self._lock:
+            for entry_key in [entry_key for entry_key in self._entries if entry_key[0] in tags]:
+                del self._entries[entry_key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses
+            }
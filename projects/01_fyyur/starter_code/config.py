@@ -12,3 +12,35 @@ DEBUG = True
 # TODO IMPLEMENT DATABASE URL
 SQLALCHEMY_DATABASE_URI = '<Put your local database url>'
 SQLALCHEMY_TRACK_MODIFICATIONS = False 
+
+# Length assumed for shows listed without a duration
+SHOW_DEFAULT_DURATION_MINUTES = 120
+
+# /changes only serves rows changed at least this long ago. updated_at is
+# the time a transaction started, so a slow transaction can commit rows
+# stamped before the cursor a client already holds; the lag has to exceed
+# the longest write transaction for them not to be skipped.
+CHANGES_SAFETY_LAG_SECONDS = 5
+
+# Rendered page cache, see cache.py
+RESPONSE_CACHE_MAX_ENTRIES = 512
+RESPONSE_CACHE_TTL = 300
+
+# Autocomplete results per normalised prefix, kept apart from the page cache
+AUTOCOMPLETE_CACHE_MAX_ENTRIES = 256
+AUTOCOMPLETE_CACHE_TTL = 300
+
+# JSON-lines request and error log, written from a background thread, see logs.py
+LOG_FILE = os.path.join(basedir, 'error.log')
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_BACKUP_COUNT = 5
+
+# Per-request SQL profiling and N+1 warnings, see profiler.py. Set
+# SQL_PROFILER_ENABLED = True here or export SQL_PROFILER=1 to turn it on.
+SQL_PROFILER_N_PLUS_ONE_THRESHOLD = 5
+
+# Write-time prerendering of the venue and artist pages, see prerender.py.
+# None (off), 'files' to write them below PRERENDER_DIRECTORY or 'table' to
+# store them in the RenderedPages table.
+PRERENDER_PAGES = None
+PRERENDER_DIRECTORY = os.path.join(basedir, 'prerendered')
@@ -0,0 +1,122 @@
+import csv
+import datetime
+import io
+import json
+import time
+import zlib
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def iter_chunks(engine, table, chunk_size=5000):
+    """
+      Yields lists of at most chunk_size rows of table, in primary key
+      order, read through a server-side cursor so only one chunk is held in
+      memory at a time.
+    """
+
+    with engine.connect() as connection:
+        result = connection.execution_options(stream_results=True).execute(
+            table.select().order_by(*table.primary_key.columns))
+
+        while True:
+            rows = result.fetchmany(chunk_size)
+
+            if not rows:
+                break
+
+            yield rows
+
+
+def _json_default(value):
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    return str(value)
+
+
+def encode(columns, chunks, fmt):
+    """
+      Turns row chunks into text chunks in the given format, with a header
+      row first for CSV.
+    """
+
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+
+        for rows in chunks:
+            writer.writerows(rows)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+        if buffer.tell():
+            yield buffer.getvalue()
+
+    elif fmt == 'ndjson':
+        for rows in chunks:
+            yield ''.join(
+                json.dumps(dict(zip(columns, row)), default=_json_default) + '\n' for row in rows)
+
+    else:
+        raise ValueError('Unsupported format: {}'.format(fmt))
+
+
+def compress(chunks):
+    """
+      gzip-compresses a stream of byte chunks incrementally.
+    """
+
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+
+    yield compressor.flush()
+
+
+class Export(object):
+    """
+      Byte stream of a whole table in CSV or NDJSON, optionally gzipped.
+      Iterate over it to produce the output; rows, elapsed and
+      rows_per_second are filled in as it goes.
+    """
+
+    def __init__(self, engine, table, fmt, gzip=False, chunk_size=5000):
+        self.engine = engine
+        self.table = table
+        self.fmt = fmt
+        self.gzip = gzip
+        self.chunk_size = chunk_size
+        self.rows = 0
+        self.elapsed = 0.0
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+    def _counted(self, chunks):
+        for rows in chunks:
+            self.rows += len(rows)
+            yield rows
+
+    def __iter__(self):
+        started = time.time()
+        columns = [column.name for column in self.table.columns]
+        chunks = self._counted(iter_chunks(self.engine, self.table, self.chunk_size))
+        data = (text.encode('utf-8') for text in encode(columns, chunks, self.fmt))
+
+        if self.gzip:
+            data = compress(data)
+
+        try:
+            for block in data:
+                yield block
+        finally:
+            self.elapsed = time.time() - started
@@ -1,7 +1,8 @@
 from datetime import datetime
 from flask_wtf import Form
 from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, BooleanField, IntegerField
-from wtforms.validators import DataRequired, AnyOf, URL, Optional
+from wtforms.validators import DataRequired, AnyOf, URL, Optional, NumberRange
+from wtforms.widgets import HiddenInput
 
 class ShowForm(Form):
     artist_id = IntegerField(
@@ -15,6 +16,10 @@ class ShowForm(Form):
         validators=[DataRequired()],
         default= datetime.today()
     )
+    # length of the show in minutes, SHOW_DEFAULT_DURATION_MINUTES when blank
+    duration = IntegerField(
+        'duration', validators=[Optional(), NumberRange(min=1, max=24 * 60)]
+    )
 
 class VenueForm(Form):
     name = StringField(
@@ -131,6 +136,11 @@ class VenueForm(Form):
         'seeking_description'
     )
 
+    # row version the edit form was loaded with
+    version = IntegerField(
+        'version', validators=[Optional()], widget=HiddenInput()
+    )
+
 class ArtistForm(Form):
     name = StringField(
         'name', validators=[DataRequired()]
@@ -243,4 +253,9 @@ class ArtistForm(Form):
         'seeking_description'
     )
 
+    # row version the edit form was loaded with
+    version = IntegerField(
+        'version', validators=[Optional()], widget=HiddenInput()
+    )
+
 # TODO IMPLEMENT NEW ARTIST FORM AND NEW SHOW FORM
\ No newline at end of file
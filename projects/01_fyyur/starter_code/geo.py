@@ -0,0 +1,114 @@
+import math
+
+EARTH_RADIUS_KM = 6371.0088
+
+# Venues are bucketed into a grid of CELL_DEGREES x CELL_DEGREES cells,
+# numbered row by row from (-90, -180). A cell is about 11 km high.
+CELL_DEGREES = 0.1
+LATITUDE_CELLS = int(round(180 / CELL_DEGREES))
+LONGITUDE_CELLS = int(round(360 / CELL_DEGREES))
+
+
+def _row(latitude):
+    return min(int(math.floor((latitude + 90) / CELL_DEGREES)), LATITUDE_CELLS - 1)
+
+
+def _column(longitude):
+    return min(int(math.floor((longitude + 180) / CELL_DEGREES)), LONGITUDE_CELLS - 1)
+
+
+def grid_cell(latitude, longitude):
+    return _row(latitude) * LONGITUDE_CELLS + _column(longitude)
+
+
+def distance_km(latitude1, longitude1, latitude2, longitude2):
+    """
+      Great-circle distance between two points, by the haversine formula.
+    """
+
+    phi1, phi2 = math.radians(latitude1), math.radians(latitude2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(longitude2 - longitude1)
+
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def bounding_boxes(latitude, longitude, km):
+    """
+      Returns the (min_latitude, max_latitude, min_longitude, max_longitude)
+      boxes that together contain every point within km of the given one.
+      The box is split in two where it crosses the antimeridian and spans
+      all longitudes where it reaches a pole.
+    """
+
+    d_latitude = math.degrees(km / EARTH_RADIUS_KM)
+    min_latitude, max_latitude = latitude - d_latitude, latitude + d_latitude
+
+    if min_latitude <= -90 or max_latitude >= 90:
+        return [(max(min_latitude, -90.0), min(max_latitude, 90.0), -180.0, 180.0)]
+
+    # widest at the latitude farthest from the equator
+    d_longitude = math.degrees(
+        km / (EARTH_RADIUS_KM * math.cos(math.radians(max(abs(min_latitude), abs(max_latitude))))))
+
+    if d_longitude >= 180:
+        return [(min_latitude, max_latitude, -180.0, 180.0)]
+
+    min_longitude, max_longitude = longitude - d_longitude, longitude + d_longitude
+
+    if min_longitude < -180:
+        return [(min_latitude, max_latitude, min_longitude + 360, 180.0),
+                (min_latitude, max_latitude, -180.0, max_longitude)]
+
+    if max_longitude > 180:
+        return [(min_latitude, max_latitude, min_longitude, 180.0),
+                (min_latitude, max_latitude, -180.0, max_longitude - 360)]
+
+    return [(min_latitude, max_latitude, min_longitude, max_longitude)]
+
+
+def cell_ranges(box):
+    """
+      Returns the (first, last) grid cell ranges covering a bounding box, one
+      contiguous range per row of cells, for B-tree range scans.
+    """
+
+    min_latitude, max_latitude, min_longitude, max_longitude = box
+    first_column, last_column = _column(min_longitude), _column(max_longitude)
+
+    return [(row * LONGITUDE_CELLS + first_column, row * LONGITUDE_CELLS + last_column)
+            for row in range(_row(min_latitude), _row(max_latitude) + 1)]
+
+
+def _normalize(value):
+    return ' '.join((value or '').lower().split())
+
+
+def lookup_key(address, city, state):
+    return (_normalize(address), _normalize(city), _normalize(state))
+
+
+def load_lookup(records):
+    """
+      Builds the geocoding lookup from records with city, state, latitude,
+      longitude and optionally address fields. Records without an address
+      give the coordinates used for any address in that city.
+    """
+
+    lookup = {}
+
+    for record in records:
+        lookup[lookup_key(record.get('address'), record['city'], record['state'])] = (
+            float(record['latitude']), float(record['longitude']))
+
+    return lookup
+
+
+def geocode(lookup, address, city, state):
+    """
+      Returns the (latitude, longitude) of an address, falling back to its
+      city, or None when neither is in the lookup.
+    """
+
+    return lookup.get(lookup_key(address, city, state)) or lookup.get(lookup_key(None, city, state))
@@ -0,0 +1,302 @@
+import csv
+import json
+import time
+import datetime
+from collections import Counter
+
+import dateutil.parser
+from psycopg2.extras import DateTimeRange
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
+
+import partitions
+
+# Columns accepted from import files for each kind of record. Anything else in
+# the file is ignored.
+FIELDS = {
+    'venues': ('name', 'city', 'state', 'address', 'phone', 'website', 'image_link',
+               'facebook_link', 'seeking_talent', 'seeking_description', 'genres'),
+    'artists': ('name', 'city', 'state', 'phone', 'website', 'image_link',
+                'facebook_link', 'seeking_venue', 'seeking_description', 'genres'),
+    'shows': ('venue_id', 'artist_id', 'start_time', 'duration'),
+}
+
+# Natural keys backing the unique constraints, used as ON CONFLICT targets
+CONFLICT_COLUMNS = {
+    'venues': ('name', 'city', 'state', 'address'),
+    'artists': ('name', 'city', 'state', 'genres'),
+}
+
+
+def read_records(stream, fmt):
+    """
+      Yields one dict per record from a CSV (with header row) or NDJSON text
+      stream without reading the whole file into memory.
+    """
+
+    if fmt == 'csv':
+        for record in csv.DictReader(stream):
+            yield record
+    elif fmt == 'ndjson':
+        for line in stream:
+            if line.strip():
+                yield json.loads(line)
+    else:
+        raise ValueError('Unsupported format: {}'.format(fmt))
+
+
+def detect_format(path):
+    if path.endswith('.csv'):
+        return 'csv'
+    if path.endswith('.ndjson') or path.endswith('.jsonl'):
+        return 'ndjson'
+    raise ValueError('Cannot tell the format of {}, pass --format'.format(path))
+
+
+def _to_bool(value):
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ('1', 'true', 't', 'yes', 'y')
+
+
+def _to_genres(value):
+    if isinstance(value, list):
+        return value
+    value = value.strip()
+    if value.startswith('['):
+        return json.loads(value)
+    return [genre.strip() for genre in value.strip('{}').split(',') if genre.strip()]
+
+
+def convert(kind, record):
+    """
+      Keeps the known columns of a raw record and coerces them to the types
+      the tables expect. Empty CSV cells become NULL. Raises ValueError or
+      TypeError for a value that cannot be coerced and for a show without
+      its venue, artist or a usable start_time and duration.
+    """
+
+    row = {}
+
+    for field in FIELDS[kind]:
+        value = record.get(field)
+
+        if value == '':
+            value = None
+
+        if value is None:
+            if field == 'genres':
+                value = []
+        elif field == 'genres':
+            value = _to_genres(value)
+        elif field in ('seeking_talent', 'seeking_venue'):
+            value = _to_bool(value)
+        elif field in ('venue_id', 'artist_id', 'duration'):
+            value = int(value)
+        elif field == 'start_time' and not isinstance(value, datetime.datetime):
+            value = dateutil.parser.parse(value)
+
+        row[field] = value
+
+    if kind == 'shows':
+        missing = [field for field in ('venue_id', 'artist_id', 'start_time') if row[field] is None]
+
+        if missing:
+            raise ValueError('missing {}'.format(', '.join(missing)))
+
+        # time_range and is_past compare against naive local times
+        if row['start_time'].tzinfo is not None:
+            raise ValueError('start_time {} has a time zone'.format(row['start_time'].isoformat()))
+
+        if row['duration'] is not None and row['duration'] <= 0:
+            raise ValueError('duration {} is not positive'.format(row['duration']))
+
+    return row
+
+
+def _convert_all(kind, records, rejected):
+    # yields (record number, row) pairs, handing the records convert()
+    # refuses to rejected instead
+    for number, record in enumerate(records, 1):
+        try:
+            row = convert(kind, record)
+        except (TypeError, ValueError, OverflowError) as e:
+            rejected(number, str(e))
+        else:
+            yield number, row
+
+
+def batched(records, size):
+    batch = []
+
+    for record in records:
+        batch.append(record)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+
+    if batch:
+        yield batch
+
+
+def _conflict_key(row, columns):
+    return tuple(tuple(row[column]) if isinstance(row[column], list) else row[column] for column in columns)
+
+
+def _dedupe(rows, columns):
+    """
+      Keeps the last of the rows sharing the same conflict columns, as ON
+      CONFLICT DO UPDATE cannot update a row twice in one statement. Rows
+      with a NULL among them never conflict and are all kept.
+    """
+
+    last = {}
+
+    for index, row in enumerate(rows):
+        key = _conflict_key(row, columns)
+
+        if None not in key:
+            last[key] = index
+
+    return [row for index, row in enumerate(rows)
+            if last.get(_conflict_key(row, columns), index) == index]
+
+
+def _insert_entities(connection, table, kind, rows, on_conflict):
+    conflict_columns = CONFLICT_COLUMNS[kind]
+
+    if on_conflict == 'update':
+        rows = _dedupe(rows, conflict_columns)
+
+    statement = insert(table).values(rows)
+
+    if on_conflict == 'update':
+        statement = statement.on_conflict_do_update(
+            index_elements=conflict_columns,
+            set_=dict({column: statement.excluded[column]
+                       for column in FIELDS[kind] if column not in conflict_columns},
+                      version=table.c.version + 1, updated_at=func.now()))
+    else:
+        statement = statement.on_conflict_do_nothing(index_elements=conflict_columns)
+
+    return connection.execute(statement).rowcount
+
+
+def _reject_unknown_references(connection, venues_table, artists_table, numbered, rejected):
+    """
+      Hands the shows whose venue or artist does not exist to rejected and
+      returns the other rows. FOR KEY SHARE keeps the venues and artists
+      that were found from being deleted before the batch commits.
+    """
+
+    known = {}
+
+    for table, key in ((venues_table, 'venue_id'), (artists_table, 'artist_id')):
+        known[key] = {row[0] for row in connection.execute(
+            'SELECT id FROM "{}" WHERE id = ANY(%(ids)s::integer[]) FOR KEY SHARE'.format(table.name),
+            {'ids': sorted({row[key] for number, row in numbered})})}
+
+    rows = []
+
+    for number, row in numbered:
+        unknown = [key for key in ('venue_id', 'artist_id') if row[key] not in known[key]]
+
+        if unknown:
+            rejected(number, 'unknown {} {}'.format(unknown[0], row[unknown[0]]))
+        else:
+            rows.append(row)
+
+    return rows
+
+
+def _insert_shows(connection, shows_table, venues_table, artists_table, rows, default_duration):
+    """
+      Inserts a batch of shows, skipping any that violate the primary key,
+      same_artist_start_time or same_artist_overlapping_time, and adds the
+      inserted shows to the upcoming/past counters of their venues and
+      artists. Shows without a duration last default_duration minutes.
+    """
+
+    now = datetime.datetime.now()
+
+    for row in rows:
+        duration = row.pop('duration') or default_duration
+        row['time_range'] = DateTimeRange(
+            row['start_time'], row['start_time'] + datetime.timedelta(minutes=duration), '[)')
+        row['is_past'] = row['start_time'] < now
+
+    # the overlap trigger covers shows in different monthly partitions,
+    # which ON CONFLICT cannot see
+    partitions.skip_overlapping_shows(connection)
+
+    statement = insert(shows_table).values(rows).on_conflict_do_nothing().returning(
+        shows_table.c.venue_id, shows_table.c.artist_id, shows_table.c.is_past)
+    inserted = connection.execute(statement).fetchall()
+
+    for table, key in ((venues_table, 'venue_id'), (artists_table, 'artist_id')):
+        upcoming = Counter(getattr(row, key) for row in inserted if not row.is_past)
+        past = Counter(getattr(row, key) for row in inserted if row.is_past)
+        ids = sorted(set(upcoming) | set(past))
+
+        if ids:
+            connection.execute(
+                'UPDATE "{}" AS t SET '
+                'upcoming_shows_count = t.upcoming_shows_count + d.upcoming, '
+                'past_shows_count = t.past_shows_count + d.past, '
+                'updated_at = now() '
+                'FROM unnest(%(ids)s::integer[], %(upcoming)s::integer[], %(past)s::integer[]) '
+                'AS d(id, upcoming, past) WHERE t.id = d.id'.format(table.name),
+                {'ids': ids,
+                 'upcoming': [upcoming[i] for i in ids],
+                 'past': [past[i] for i in ids]})
+
+    return len(inserted)
+
+
+def import_records(engine, tables, kind, records, batch_size=5000, on_conflict='skip', progress=None,
+                   default_duration=120, rejected=None):
+    """
+      Loads records of the given kind ('venues', 'artists' or 'shows') with
+      one multi-row INSERT ... ON CONFLICT per batch, committing each batch,
+      so memory use is bounded by batch_size. tables maps each kind to its
+      Table. progress is called with (read, written, elapsed seconds) after
+      every batch. Returns the same triple for the whole run. Shows without
+      a duration last default_duration minutes.
+
+      Records that cannot be converted and shows of unknown venues or
+      artists are skipped rather than aborting the run; rejected is called
+      with the record number (counting from 1) and the reason for each.
+    """
+
+    read = written = 0
+    started = time.time()
+
+    if rejected is None:
+        rejected = lambda number, reason: None
+
+    def count_read(records):
+        nonlocal read
+
+        for record in records:
+            read += 1
+            yield record
+
+    for batch in batched(_convert_all(kind, count_read(records), rejected), batch_size):
+
+        with engine.begin() as connection:
+            if kind == 'shows':
+                rows = _reject_unknown_references(
+                    connection, tables['venues'], tables['artists'], batch, rejected)
+
+                if rows:
+                    written += _insert_shows(
+                        connection, tables['shows'], tables['venues'], tables['artists'], rows,
+                        default_duration)
+            else:
+                written += _insert_entities(connection, tables[kind], kind, [row for number, row in batch],
+                                            on_conflict)
+
+        if progress is not None:
+            progress(read, written, time.time() - started)
+
+    return read, written, time.time() - started
@@ -0,0 +1,115 @@
+import atexit
+import datetime
+import json
+import logging
+import queue
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Attributes every LogRecord has; anything else was passed through extra=
+# and is written out as its own JSON field.
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class JSONFormatter(logging.Formatter):
+    """
+      Formats a record as a single JSON object per line.
+    """
+
+    def format(self, record):
+        entry = {
+            'time': datetime.datetime.utcfromtimestamp(record.created).isoformat() + 'Z',
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'location': '{}:{}'.format(record.pathname, record.lineno)
+        }
+
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+
+        return json.dumps(entry, default=str)
+
+
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and 'sql_count' in g:
+        g.sql_count += 1
+
+
+def _reset_query_count():
+    g.sql_count = 0
+
+
+def count_queries(app):
+    """
+      Counts the SQL statements each request of app runs in g.sql_count.
+      Used by both the request log and SQLProfiler, which registers it
+      again; the statements are counted once either way.
+    """
+
+    if app.extensions.get('sql_count'):
+        return
+
+    app.extensions['sql_count'] = True
+
+    if not event.contains(Engine, 'before_cursor_execute', _count_query):
+        event.listen(Engine, 'before_cursor_execute', _count_query)
+
+    app.before_request(_reset_query_count)
+
+
+def init_logging(app):
+    """
+      Sends app.logger through a queue so the request thread only formats
+      the record, while a background QueueListener writes the JSON lines to
+      a rotating LOG_FILE. Also logs one line per request with its duration
+      and the number of SQL statements it ran.
+    """
+
+    log_queue = queue.Queue(-1)
+
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.setFormatter(JSONFormatter())
+    queue_handler.setLevel(logging.INFO)
+
+    file_handler = RotatingFileHandler(
+        app.config.get('LOG_FILE', 'error.log'),
+        maxBytes=app.config.get('LOG_MAX_BYTES', 10 * 1024 * 1024),
+        backupCount=app.config.get('LOG_BACKUP_COUNT', 5))
+    # records arrive already formatted by the queue handler
+    file_handler.setFormatter(logging.Formatter('%(message)s'))
+
+    listener = QueueListener(log_queue, file_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
+    app.logger.setLevel(logging.INFO)
+    app.logger.addHandler(queue_handler)
+
+    count_queries(app)
+
+    @app.before_request
+    def start_request_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def log_request(response):
+        if 'request_started' in g:
+            app.logger.info('request', extra={
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'duration_ms': round((time.perf_counter() - g.request_started) * 1000, 2),
+                'sql_count': g.sql_count
+            })
+        return response
+
+    return listener
@@ -0,0 +1,29 @@
+"""name trigram indexes
+
+Revision ID: 027cd774df41
+Revises: c3774a83215a
+Create Date: 2026-10-18 09:12:40.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '027cd774df41'
+down_revision = 'c3774a83215a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.create_index('ix_Venues_name_trgm', 'Venues', ['name'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+    op.create_index('ix_Artists_name_trgm', 'Artists', ['name'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+
+
+def downgrade():
+    op.drop_index('ix_Artists_name_trgm', table_name='Artists')
+    op.drop_index('ix_Venues_name_trgm', table_name='Venues')
@@ -0,0 +1,26 @@
+"""venue and artist version
+
+Revision ID: 27c762c5e233
+Revises: a4afbb140c1b
+Create Date: 2026-10-18 17:48:22.905116
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '27c762c5e233'
+down_revision = 'a4afbb140c1b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('Venues', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+    op.add_column('Artists', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade():
+    op.drop_column('Artists', 'version')
+    op.drop_column('Venues', 'version')
@@ -0,0 +1,38 @@
+"""show time window indexes
+
+Revision ID: 3c2ebadbb084
+Revises: aa8328f86efd
+Create Date: 2026-10-18 14:05:51.772430
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c2ebadbb084'
+down_revision = 'aa8328f86efd'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+    with op.get_context().autocommit_block():
+        op.create_index('ix_Shows_artist_id_start_time', 'Shows', ['artist_id', 'start_time'],
+                        unique=False, postgresql_concurrently=True)
+        op.create_index('ix_Shows_venue_id_start_time', 'Shows', ['venue_id', 'start_time'],
+                        unique=False, postgresql_concurrently=True)
+        op.create_index('ix_Shows_start_time_venue_id_artist_id', 'Shows',
+                        ['start_time', 'venue_id', 'artist_id'],
+                        unique=False, postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_Shows_start_time_venue_id_artist_id', table_name='Shows',
+                      postgresql_concurrently=True)
+        op.drop_index('ix_Shows_venue_id_start_time', table_name='Shows',
+                      postgresql_concurrently=True)
+        op.drop_index('ix_Shows_artist_id_start_time', table_name='Shows',
+                      postgresql_concurrently=True)
@@ -0,0 +1,45 @@
+"""related entities
+
+Revision ID: 43c51e81e00e
+Revises: 832be95c9256
+Create Date: 2026-10-19 00:21:52.614880
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '43c51e81e00e'
+down_revision = '832be95c9256'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # filled by flask build-related
+    op.create_table('SimilarityBuckets',
+    sa.Column('kind', sa.String(length=16), nullable=False),
+    sa.Column('entity_id', sa.Integer(), nullable=False),
+    sa.Column('band_key', sa.BigInteger(), nullable=False),
+    sa.PrimaryKeyConstraint('kind', 'entity_id', 'band_key')
+    )
+    op.create_index(op.f('ix_SimilarityBuckets_band_key'), 'SimilarityBuckets', ['band_key'], unique=False)
+
+    op.create_table('RelatedEntities',
+    sa.Column('kind', sa.String(length=16), nullable=False),
+    sa.Column('entity_id', sa.Integer(), nullable=False),
+    sa.Column('related_kind', sa.String(length=16), nullable=False),
+    sa.Column('related_id', sa.Integer(), nullable=False),
+    sa.Column('score', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('kind', 'entity_id', 'related_kind', 'related_id')
+    )
+    op.create_index('ix_RelatedEntities_related_kind_related_id', 'RelatedEntities',
+                    ['related_kind', 'related_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_RelatedEntities_related_kind_related_id', table_name='RelatedEntities')
+    op.drop_table('RelatedEntities')
+    op.drop_index(op.f('ix_SimilarityBuckets_band_key'), table_name='SimilarityBuckets')
+    op.drop_table('SimilarityBuckets')
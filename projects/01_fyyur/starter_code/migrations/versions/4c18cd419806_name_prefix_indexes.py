@@ -0,0 +1,27 @@
+"""name prefix indexes
+
+Revision ID: 4c18cd419806
+Revises: 27c762c5e233
+Create Date: 2026-10-18 19:02:44.651380
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4c18cd419806'
+down_revision = '27c762c5e233'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # text_pattern_ops lets LIKE 'prefix%' use the index under any collation
+    op.execute('CREATE INDEX "ix_Venues_lower_name_pattern" ON "Venues" (lower(name) text_pattern_ops)')
+    op.execute('CREATE INDEX "ix_Artists_lower_name_pattern" ON "Artists" (lower(name) text_pattern_ops)')
+
+
+def downgrade():
+    op.drop_index('ix_Artists_lower_name_pattern', table_name='Artists')
+    op.drop_index('ix_Venues_lower_name_pattern', table_name='Venues')
@@ -0,0 +1,55 @@
+"""backfill upcoming show ranges
+
+Revision ID: 5d3f8a91c2b7
+Revises: 680b3e108671
+Create Date: 2026-10-19 09:14:27.530118
+
+"""
+import logging
+
+from alembic import op
+import sqlalchemy as sa
+from flask import current_app
+
+
+# revision identifiers, used by Alembic.
+revision = '5d3f8a91c2b7'
+down_revision = '680b3e108671'
+branch_labels = None
+depends_on = None
+
+logger = logging.getLogger('alembic.runtime.migration')
+
+
+def upgrade():
+    # cd89ae6a0527 stored the shows that existed before durations as
+    # instants, which never clash with a new booking or show the artist
+    # as busy. Give the ones that have not started the default duration,
+    # cut short where it would run into the artist's next show. Past shows
+    # stay instants.
+    connection = op.get_bind()
+    duration = current_app.config.get('SHOW_DEFAULT_DURATION_MINUTES', 120)
+
+    result = connection.execute(sa.text('''
+        UPDATE "Shows" s SET
+          time_range = tsrange(s.start_time, least(s.start_time + :duration * interval '1 minute', n.next_start), '[)'),
+          updated_at = now()
+        FROM (
+          SELECT artist_id, start_time,
+            lead(start_time) OVER (PARTITION BY artist_id ORDER BY start_time) AS next_start
+          FROM "Shows"
+          WHERE start_time >= now()
+        ) n
+        WHERE s.artist_id = n.artist_id AND s.start_time = n.start_time
+          AND lower(s.time_range) = upper(s.time_range)
+        RETURNING s.start_time + :duration * interval '1 minute' > n.next_start AS shortened
+    '''), duration=duration).fetchall()
+
+    shortened = sum(1 for row in result if row.shortened)
+    logger.info('gave %d upcoming shows a %d minute time_range, %d of them cut short by the '
+                'artist\'s next show', len(result), duration, shortened)
+
+
+def downgrade():
+    # the instants are not restored; a range is as valid as before
+    pass
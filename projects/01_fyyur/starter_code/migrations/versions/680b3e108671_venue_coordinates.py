@@ -0,0 +1,31 @@
+"""venue coordinates
+
+Revision ID: 680b3e108671
+Revises: 43c51e81e00e
+Create Date: 2026-10-19 00:54:13.208861
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '680b3e108671'
+down_revision = '43c51e81e00e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # filled by flask geocode-venues
+    op.add_column('Venues', sa.Column('latitude', sa.Float(), nullable=True))
+    op.add_column('Venues', sa.Column('longitude', sa.Float(), nullable=True))
+    op.add_column('Venues', sa.Column('grid_cell', sa.Integer(), nullable=True))
+    op.create_index(op.f('ix_Venues_grid_cell'), 'Venues', ['grid_cell'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_Venues_grid_cell'), table_name='Venues')
+    op.drop_column('Venues', 'grid_cell')
+    op.drop_column('Venues', 'longitude')
+    op.drop_column('Venues', 'latitude')
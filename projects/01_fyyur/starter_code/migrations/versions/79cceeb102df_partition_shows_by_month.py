@@ -0,0 +1,127 @@
+"""partition shows by month
+
+Revision ID: 79cceeb102df
+Revises: b36870af2e84
+Create Date: 2026-10-18 23:12:44.806517
+
+"""
+import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '79cceeb102df'
+down_revision = 'b36870af2e84'
+branch_labels = None
+depends_on = None
+
+# months of partitions created ahead of the current one
+FUTURE_MONTHS = 12
+
+
+def _month_start(moment):
+    return datetime.datetime(moment.year, moment.month, 1)
+
+
+def _add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return datetime.datetime(index // 12, index % 12 + 1, 1)
+
+
+def _add_overlap_constraint(table):
+    op.execute(
+        'ALTER TABLE "{0}" ADD CONSTRAINT "{0}_same_artist_overlapping_time" '
+        'EXCLUDE USING gist (artist_id WITH =, time_range WITH &&)'.format(table))
+
+
+def _create_constraints_and_indexes(table='Shows'):
+    op.create_primary_key('Shows_pkey', table, ['venue_id', 'artist_id', 'start_time'])
+    op.create_unique_constraint('same_artist_start_time', table, ['artist_id', 'start_time'])
+    op.create_foreign_key('Shows_venue_id_fkey', table, 'Venues', ['venue_id'], ['id'], ondelete='CASCADE')
+    op.create_foreign_key('Shows_artist_id_fkey', table, 'Artists', ['artist_id'], ['id'], ondelete='CASCADE')
+    op.create_index('ix_Shows_upcoming_start_time', table, ['start_time'],
+                    unique=False, postgresql_where=sa.text('NOT is_past'))
+    op.create_index('ix_Shows_artist_id_start_time', table, ['artist_id', 'start_time'], unique=False)
+    op.create_index('ix_Shows_venue_id_start_time', table, ['venue_id', 'start_time'], unique=False)
+    op.create_index('ix_Shows_start_time_venue_id_artist_id', table,
+                    ['start_time', 'venue_id', 'artist_id'], unique=False)
+    op.create_index('ix_Shows_updated_at', table, ['updated_at'], unique=False)
+
+
+def upgrade():
+    connection = op.get_bind()
+
+    # constraints and indexes are added after the copy, so build the new
+    # table under a temporary name and swap it in
+    op.execute('CREATE TABLE "Shows_partitioned" (LIKE "Shows" INCLUDING DEFAULTS) '
+               'PARTITION BY RANGE (start_time)')
+
+    now = datetime.datetime.now()
+    first, last = connection.execute(sa.text('SELECT min(start_time), max(start_time) FROM "Shows"')).first()
+    first, last = min(first or now, now), max(last or now, now)
+
+    month = _month_start(first)
+    end = _add_months(_month_start(last), FUTURE_MONTHS + 1)
+
+    while month < end:
+        name = 'Shows_y{:04d}m{:02d}'.format(month.year, month.month)
+        connection.execute(sa.text(
+            'CREATE TABLE "{}" PARTITION OF "Shows_partitioned" FOR VALUES FROM (:lower) TO (:upper)'.format(
+                name)), lower=month, upper=_add_months(month, 1))
+        _add_overlap_constraint(name)
+        month = _add_months(month, 1)
+
+    op.execute('CREATE TABLE "Shows_default" PARTITION OF "Shows_partitioned" DEFAULT')
+    _add_overlap_constraint('Shows_default')
+
+    op.execute('INSERT INTO "Shows_partitioned" SELECT * FROM "Shows"')
+    op.drop_table('Shows')
+    op.rename_table('Shows_partitioned', 'Shows')
+
+    _create_constraints_and_indexes()
+
+    # the per-partition exclusion constraints miss overlaps across a month
+    # boundary, which this trigger rejects instead
+    op.execute('''
+        CREATE OR REPLACE FUNCTION shows_reject_overlap() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_advisory_xact_lock(hashtext('Shows'), NEW.artist_id);
+
+            IF EXISTS (
+                SELECT 1 FROM "Shows"
+                WHERE artist_id = NEW.artist_id
+                  AND start_time < upper(NEW.time_range)
+                  AND time_range && NEW.time_range
+            ) THEN
+                IF current_setting('fyyur.skip_overlapping_shows', true) = 'on' THEN
+                    RETURN NULL;
+                END IF;
+
+                RAISE EXCEPTION 'show overlaps another show of the same artist'
+                    USING ERRCODE = 'exclusion_violation', CONSTRAINT = 'same_artist_overlapping_time';
+            END IF;
+
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+    ''')
+    op.execute('CREATE TRIGGER same_artist_overlapping_time BEFORE INSERT ON "Shows" '
+               'FOR EACH ROW EXECUTE PROCEDURE shows_reject_overlap()')
+
+
+def downgrade():
+    op.execute('CREATE TABLE "Shows_unpartitioned" (LIKE "Shows" INCLUDING DEFAULTS)')
+    op.execute('INSERT INTO "Shows_unpartitioned" SELECT * FROM "Shows"')
+
+    # drops the monthly and default partitions along with the parent
+    op.drop_table('Shows')
+    op.execute('DROP FUNCTION IF EXISTS shows_reject_overlap()')
+    op.rename_table('Shows_unpartitioned', 'Shows')
+
+    _create_constraints_and_indexes()
+    op.create_exclude_constraint(
+        'same_artist_overlapping_time', 'Shows',
+        ('artist_id', '='), ('time_range', '&&'),
+        using='gist')
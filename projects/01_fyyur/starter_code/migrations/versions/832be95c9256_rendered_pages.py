@@ -0,0 +1,29 @@
+"""rendered pages
+
+Revision ID: 832be95c9256
+Revises: 79cceeb102df
+Create Date: 2026-10-18 23:48:21.337095
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '832be95c9256'
+down_revision = '79cceeb102df'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('RenderedPages',
+    sa.Column('key', sa.String(), nullable=False),
+    sa.Column('body', sa.LargeBinary(), nullable=False),
+    sa.Column('rendered_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('key')
+    )
+
+
+def downgrade():
+    op.drop_table('RenderedPages')
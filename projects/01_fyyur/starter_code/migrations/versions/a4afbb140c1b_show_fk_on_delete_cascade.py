@@ -0,0 +1,30 @@
+"""show foreign keys on delete cascade
+
+Revision ID: a4afbb140c1b
+Revises: 3c2ebadbb084
+Create Date: 2026-10-18 16:31:07.284519
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4afbb140c1b'
+down_revision = '3c2ebadbb084'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.drop_constraint('Shows_venue_id_fkey', 'Shows', type_='foreignkey')
+    op.drop_constraint('Shows_artist_id_fkey', 'Shows', type_='foreignkey')
+    op.create_foreign_key('Shows_venue_id_fkey', 'Shows', 'Venues', ['venue_id'], ['id'], ondelete='CASCADE')
+    op.create_foreign_key('Shows_artist_id_fkey', 'Shows', 'Artists', ['artist_id'], ['id'], ondelete='CASCADE')
+
+
+def downgrade():
+    op.drop_constraint('Shows_artist_id_fkey', 'Shows', type_='foreignkey')
+    op.drop_constraint('Shows_venue_id_fkey', 'Shows', type_='foreignkey')
+    op.create_foreign_key('Shows_artist_id_fkey', 'Shows', 'Artists', ['artist_id'], ['id'])
+    op.create_foreign_key('Shows_venue_id_fkey', 'Shows', 'Venues', ['venue_id'], ['id'])
@@ -0,0 +1,52 @@
+"""show counters
+
+Revision ID: aa8328f86efd
+Revises: 027cd774df41
+Create Date: 2026-10-18 11:40:02.530917
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'aa8328f86efd'
+down_revision = '027cd774df41'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('Venues', sa.Column('upcoming_shows_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('Venues', sa.Column('past_shows_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('Artists', sa.Column('upcoming_shows_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('Artists', sa.Column('past_shows_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('Shows', sa.Column('is_past', sa.Boolean(), server_default='false', nullable=False))
+
+    op.execute('UPDATE "Shows" SET is_past = start_time < now()')
+
+    for table, key in (('Venues', 'venue_id'), ('Artists', 'artist_id')):
+        op.execute('''
+            UPDATE "{table}" SET
+                upcoming_shows_count = counts.upcoming,
+                past_shows_count = counts.past
+            FROM (
+                SELECT {key},
+                    count(*) FILTER (WHERE NOT is_past) AS upcoming,
+                    count(*) FILTER (WHERE is_past) AS past
+                FROM "Shows" GROUP BY {key}
+            ) counts
+            WHERE "{table}".id = counts.{key}
+        '''.format(table=table, key=key))
+
+    op.create_index('ix_Shows_upcoming_start_time', 'Shows', ['start_time'], unique=False,
+                    postgresql_where=sa.text('NOT is_past'))
+
+
+def downgrade():
+    op.drop_index('ix_Shows_upcoming_start_time', table_name='Shows')
+    op.drop_column('Shows', 'is_past')
+    op.drop_column('Artists', 'past_shows_count')
+    op.drop_column('Artists', 'upcoming_shows_count')
+    op.drop_column('Venues', 'past_shows_count')
+    op.drop_column('Venues', 'upcoming_shows_count')
@@ -0,0 +1,43 @@
+"""change feed
+
+Revision ID: b36870af2e84
+Revises: cd89ae6a0527
+Create Date: 2026-10-18 22:41:07.518203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b36870af2e84'
+down_revision = 'cd89ae6a0527'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # existing rows count as changed at migration time, so clients starting
+    # from an empty cursor receive everything once
+    for table in ('Venues', 'Artists', 'Shows'):
+        op.add_column(table, sa.Column('updated_at', sa.DateTime(), nullable=False,
+            server_default=sa.text('now()')))
+        op.create_index(op.f('ix_{}_updated_at'.format(table)), table, ['updated_at'], unique=False)
+
+    op.create_table('Tombstones',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('kind', sa.String(length=16), nullable=False),
+    sa.Column('key', sa.String(), nullable=False),
+    sa.Column('deleted_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_Tombstones_deleted_at'), 'Tombstones', ['deleted_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_Tombstones_deleted_at'), table_name='Tombstones')
+    op.drop_table('Tombstones')
+
+    for table in ('Shows', 'Artists', 'Venues'):
+        op.drop_index(op.f('ix_{}_updated_at'.format(table)), table_name=table)
+        op.drop_column(table, 'updated_at')
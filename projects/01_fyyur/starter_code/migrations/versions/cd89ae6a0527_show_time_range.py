@@ -0,0 +1,39 @@
+"""show time range
+
+Revision ID: cd89ae6a0527
+Revises: d66413bd6108
+Create Date: 2026-10-18 21:37:55.190264
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'cd89ae6a0527'
+down_revision = 'd66413bd6108'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # needed for the = operator on artist_id inside a GiST exclusion constraint
+    op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+
+    op.add_column('Shows', sa.Column('time_range', postgresql.TSRANGE(), nullable=True))
+
+    # existing shows have no known length; a single instant cannot overlap
+    # anything same_artist_start_time does not already reject
+    op.execute("UPDATE \"Shows\" SET time_range = tsrange(start_time, start_time, '[]')")
+    op.alter_column('Shows', 'time_range', existing_type=postgresql.TSRANGE(), nullable=False)
+
+    op.create_exclude_constraint(
+        'same_artist_overlapping_time', 'Shows',
+        ('artist_id', '='), ('time_range', '&&'),
+        using='gist')
+
+
+def downgrade():
+    op.drop_constraint('same_artist_overlapping_time', 'Shows')
+    op.drop_column('Shows', 'time_range')
@@ -0,0 +1,26 @@
+"""genres gin indexes
+
+Revision ID: d66413bd6108
+Revises: 4c18cd419806
+Create Date: 2026-10-18 20:14:09.338671
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd66413bd6108'
+down_revision = '4c18cd419806'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_Venues_genres', 'Venues', ['genres'], unique=False, postgresql_using='gin')
+    op.create_index('ix_Artists_genres', 'Artists', ['genres'], unique=False, postgresql_using='gin')
+
+
+def downgrade():
+    op.drop_index('ix_Artists_genres', table_name='Artists')
+    op.drop_index('ix_Venues_genres', table_name='Venues')
@@ -0,0 +1,218 @@
+import datetime
+import re
+
+from sqlalchemy import text
+
+PARENT = 'Shows'
+DEFAULT_PARTITION = 'Shows_default'
+ARCHIVE_SCHEMA = 'archive'
+PARTITION_NAME = re.compile(r'^Shows_y(\d{4})m(\d{2})$')
+
+# Set to 'on' for a transaction to skip overlapping shows instead of
+# rejecting them, like ON CONFLICT DO NOTHING does for the other constraints.
+SKIP_OVERLAPPING_SETTING = 'fyyur.skip_overlapping_shows'
+
+# The per-partition exclusion constraints cannot see shows in other months,
+# so a show running past midnight at the end of a month could overlap one
+# early on the 1st. This trigger probes every partition up to the end of
+# the new show through their GiST indexes. The advisory lock serializes
+# bookings per artist so that concurrent inserts see each other. BEFORE
+# ROW triggers on partitioned tables need PostgreSQL 13.
+OVERLAP_FUNCTION_SQL = '''
+CREATE OR REPLACE FUNCTION shows_reject_overlap() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_advisory_xact_lock(hashtext('Shows'), NEW.artist_id);
+
+    IF EXISTS (
+        SELECT 1 FROM "Shows"
+        WHERE artist_id = NEW.artist_id
+          AND start_time < upper(NEW.time_range)
+          AND time_range && NEW.time_range
+    ) THEN
+        IF current_setting('%s', true) = 'on' THEN
+            RETURN NULL;
+        END IF;
+
+        RAISE EXCEPTION 'show overlaps another show of the same artist'
+            USING ERRCODE = 'exclusion_violation', CONSTRAINT = 'same_artist_overlapping_time';
+    END IF;
+
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql
+''' % SKIP_OVERLAPPING_SETTING
+
+OVERLAP_TRIGGER_SQL = (
+    'CREATE TRIGGER same_artist_overlapping_time BEFORE INSERT ON "Shows" '
+    'FOR EACH ROW EXECUTE PROCEDURE shows_reject_overlap()')
+
+
+def month_start(moment):
+    return datetime.datetime(moment.year, moment.month, 1)
+
+
+def add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return datetime.datetime(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return 'Shows_y{:04d}m{:02d}'.format(month.year, month.month)
+
+
+def _add_overlap_constraint(connection, name):
+    # A partitioned table cannot carry an exclusion constraint that does not
+    # cover the partition key, so each partition gets its own. Overlaps
+    # between shows in different months are caught by the overlap trigger.
+    connection.execute(text(
+        'ALTER TABLE "{0}" ADD CONSTRAINT "{0}_same_artist_overlapping_time" '
+        'EXCLUDE USING gist (artist_id WITH =, time_range WITH &&)'.format(name)))
+
+
+def create_overlap_trigger(connection):
+    connection.execute(text(OVERLAP_FUNCTION_SQL))
+    connection.execute(text(OVERLAP_TRIGGER_SQL))
+
+
+def skip_overlapping_shows(connection):
+    """
+      Makes the overlap trigger drop overlapping shows instead of raising,
+      until the end of the current transaction.
+    """
+
+    connection.execute(text("SELECT set_config('{}', 'on', true)".format(SKIP_OVERLAPPING_SETTING)))
+
+
+def create_default_partition(connection):
+    """
+      Creates the partition catching shows outside every monthly partition,
+      so inserts never fail for lack of one.
+    """
+
+    connection.execute(text(
+        'CREATE TABLE "{}" PARTITION OF "{}" DEFAULT'.format(DEFAULT_PARTITION, PARENT)))
+    _add_overlap_constraint(connection, DEFAULT_PARTITION)
+
+
+def list_partitions(connection):
+    """
+      Returns the (month, name) pairs of the monthly partitions attached to
+      Shows, oldest first.
+    """
+
+    rows = connection.execute(text(
+        'SELECT c.relname FROM pg_inherits i '
+        'JOIN pg_class c ON c.oid = i.inhrelid '
+        'WHERE i.inhparent = CAST(:parent AS regclass)'), {'parent': '"{}"'.format(PARENT)})
+
+    partitions = []
+
+    for (name,) in rows:
+        match = PARTITION_NAME.match(name)
+
+        if match:
+            partitions.append((datetime.datetime(int(match.group(1)), int(match.group(2)), 1), name))
+
+    return sorted(partitions)
+
+
+def _create_partition(connection, name, lower, upper):
+    connection.execute(text(
+        'CREATE TABLE "{}" PARTITION OF "{}" FOR VALUES FROM (:lower) TO (:upper)'.format(
+            name, PARENT)), {'lower': lower, 'upper': upper})
+    _add_overlap_constraint(connection, name)
+
+
+def create_partitions(connection, start, months):
+    """
+      Creates the monthly partitions for the months months starting with
+      the month of start that do not exist yet, and returns their names.
+
+      Shows booked beyond the last partition land in the default partition,
+      and Postgres refuses to create a partition for rows the default one
+      already holds. So for such a month the default partition is detached,
+      the new partition created, the month's shows moved over and the
+      default partition attached again, all in the caller's transaction.
+    """
+
+    existing = set(name for _, name in list_partitions(connection))
+    first = month_start(start)
+    created = []
+
+    for offset in range(months):
+        month = add_months(first, offset)
+        name = partition_name(month)
+
+        if name in existing:
+            continue
+
+        bounds = {'lower': month, 'upper': add_months(month, 1)}
+
+        stranded = connection.execute(text(
+            'SELECT EXISTS (SELECT 1 FROM "{}" WHERE start_time >= :lower AND start_time < :upper)'.format(
+                DEFAULT_PARTITION)), bounds).scalar()
+
+        if stranded:
+            connection.execute(text('ALTER TABLE "{}" DETACH PARTITION "{}"'.format(
+                PARENT, DEFAULT_PARTITION)))
+
+        _create_partition(connection, name, bounds['lower'], bounds['upper'])
+
+        if stranded:
+            connection.execute(text(
+                'WITH moved AS (DELETE FROM "{0}" WHERE start_time >= :lower AND start_time < :upper '
+                'RETURNING *) INSERT INTO "{1}" SELECT * FROM moved'.format(DEFAULT_PARTITION, name)),
+                bounds)
+            connection.execute(text('ALTER TABLE "{}" ATTACH PARTITION "{}" DEFAULT'.format(
+                PARENT, DEFAULT_PARTITION)))
+
+        created.append(name)
+
+    return created
+
+
+def archive_partitions(connection, before, drop=False):
+    """
+      Detaches the monthly partitions holding only shows before the month of
+      before. The detached tables are moved to the archive schema, or
+      dropped with drop=True. Their shows no longer appear anywhere in the
+      app, so they are subtracted from the venue and artist counters first.
+      Returns the names of the archived partitions and the ids of the
+      venues and of the artists whose shows they held.
+    """
+
+    archived = []
+    affected = {'Venues': set(), 'Artists': set()}
+
+    for month, name in list_partitions(connection):
+        if add_months(month, 1) > month_start(before):
+            break
+
+        for table, key in (('Venues', 'venue_id'), ('Artists', 'artist_id')):
+            rows = connection.execute(text('''
+                UPDATE "{table}" AS t SET
+                  upcoming_shows_count = t.upcoming_shows_count - d.upcoming,
+                  past_shows_count = t.past_shows_count - d.past,
+                  updated_at = now()
+                FROM (
+                  SELECT {key} AS id,
+                    count(*) FILTER (WHERE NOT is_past) AS upcoming,
+                    count(*) FILTER (WHERE is_past) AS past
+                  FROM "{partition}" GROUP BY {key}
+                ) d
+                WHERE t.id = d.id
+                RETURNING t.id
+            '''.format(table=table, key=key, partition=name)))
+            affected[table].update(row[0] for row in rows)
+
+        connection.execute(text('ALTER TABLE "{}" DETACH PARTITION "{}"'.format(PARENT, name)))
+
+        if drop:
+            connection.execute(text('DROP TABLE "{}"'.format(name)))
+        else:
+            connection.execute(text('CREATE SCHEMA IF NOT EXISTS {}'.format(ARCHIVE_SCHEMA)))
+            connection.execute(text('ALTER TABLE "{}" SET SCHEMA {}'.format(name, ARCHIVE_SCHEMA)))
+
+        archived.append(name)
+
+    return archived, sorted(affected['Venues']), sorted(affected['Artists'])
@@ -0,0 +1,175 @@
+import os
+import tempfile
+from functools import wraps
+
+from flask import current_app, session, make_response
+from flask_wtf.csrf import generate_csrf
+from sqlalchemy import select, func
+from sqlalchemy.dialects.postgresql import insert
+
+from cache import CSRF_PLACEHOLDER
+
+MODES = ('files', 'table')
+
+
+class PrerenderedPages(object):
+    """
+      Detail pages rendered when their data is written rather than when
+      they are requested.
+
+      With PRERENDER_PAGES set to 'files' the pages are written below
+      PRERENDER_DIRECTORY, with 'table' they are stored in the RenderedPages
+      table, and with None (the default) nothing is prerendered. Write
+      handlers call refresh() after committing; serves() then answers GETs
+      with the stored bytes and only falls through to the view when a page
+      is missing. Unlike ResponseCache the pages are shared by every worker
+      process and never expire.
+    """
+
+    def __init__(self, app=None, table=None, engine=None):
+        self._renderers = {}
+        self.mode = None
+        self.directory = None
+        self.table = None
+        self._engine = None
+
+        if app is not None:
+            self.init_app(app, table, engine)
+
+    def init_app(self, app, table=None, engine=None):
+        """
+          table is the RenderedPages table and engine a function returning
+          the engine to reach it with; both are only used in 'table' mode.
+        """
+
+        self.table = table
+        self._engine = engine
+        self.mode = app.config.get('PRERENDER_PAGES')
+        self.directory = app.config.get('PRERENDER_DIRECTORY')
+
+        if self.mode is not None and self.mode not in MODES:
+            raise ValueError('PRERENDER_PAGES must be one of {} or None'.format(', '.join(MODES)))
+
+    @property
+    def enabled(self):
+        return self.mode is not None
+
+    def renderer(self, kind, path):
+        """
+          Registers the decorated function as the renderer of kind pages.
+          It takes an id and returns the page HTML, or None once the entity
+          is gone. path is the page URL as a format string of the id; pages
+          are rendered in a request context for it.
+        """
+
+        def decorator(render):
+            self._renderers[kind] = (render, path)
+            return render
+
+        return decorator
+
+    def serves(self, kind, argument):
+        """
+          Decorator for the GET view of kind pages, whose id is the view
+          argument named argument.
+        """
+
+        def decorator(view):
+
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+
+                # pending flash messages are rendered into the page once only
+                if self.enabled and '_flashes' not in session:
+                    body = self.load(kind, kwargs[argument])
+
+                    if body is not None:
+                        return make_response(body.replace(CSRF_PLACEHOLDER, generate_csrf().encode()))
+
+                return view(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def refresh(self, kind, ids):
+        """
+          Re-renders the kind pages of the given ids and stores them, or
+          removes those whose entity no longer exists. A page that fails to
+          render is removed so that it is served live until the next
+          refresh.
+        """
+
+        if not self.enabled:
+            return
+
+        render, path = self._renderers[kind]
+        app = current_app._get_current_object()
+
+        for entity_id in set(ids):
+            try:
+                with app.test_request_context(path.format(entity_id)):
+                    html = render(entity_id)
+
+                    if html is None:
+                        self.discard(kind, entity_id)
+                    else:
+                        self._store(kind, entity_id,
+                                    html.encode().replace(generate_csrf().encode(), CSRF_PLACEHOLDER))
+            except Exception:
+                app.logger.exception('prerendering %s %s failed', kind, entity_id)
+                self.discard(kind, entity_id)
+
+    def load(self, kind, entity_id):
+        if self.mode == 'files':
+            try:
+                with open(self._path(kind, entity_id), 'rb') as f:
+                    return f.read()
+            except (IOError, OSError):
+                return None
+
+        with self._engine().connect() as connection:
+            return connection.execute(select([self.table.c.body]).where(
+                self.table.c.key == self._key(kind, entity_id))).scalar()
+
+    def discard(self, kind, entity_id):
+        if self.mode == 'files':
+            try:
+                os.remove(self._path(kind, entity_id))
+            except (IOError, OSError):
+                pass
+            return
+
+        with self._engine().begin() as connection:
+            connection.execute(self.table.delete().where(
+                self.table.c.key == self._key(kind, entity_id)))
+
+    def _store(self, kind, entity_id, body):
+        if self.mode == 'files':
+            path = self._path(kind, entity_id)
+            directory = os.path.dirname(path)
+
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+
+            # write then rename, so readers never see a partial page
+            fd, temporary = tempfile.mkstemp(dir=directory)
+
+            with os.fdopen(fd, 'wb') as f:
+                f.write(body)
+
+            os.replace(temporary, path)
+            return
+
+        statement = insert(self.table).values(key=self._key(kind, entity_id), body=body)
+
+        with self._engine().begin() as connection:
+            connection.execute(statement.on_conflict_do_update(
+                index_elements=[self.table.c.key],
+                set_={'body': statement.excluded.body, 'rendered_at': func.now()}))
+
+    def _key(self, kind, entity_id):
+        return '{}:{}'.format(kind, entity_id)
+
+    def _path(self, kind, entity_id):
+        return os.path.join(self.directory, kind, '{}.html'.format(entity_id))
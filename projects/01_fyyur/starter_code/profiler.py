@@ -0,0 +1,140 @@
+import logging
+import os
+import re
+import time
+from collections import Counter
+
+from flask import g, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from logs import count_queries
+
+_PLACEHOLDER = re.compile(r'%\(\w+\)s|%s|(?<!:):\w+')
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\bIN\s*\((?:\s*\?\s*,)*\s*\?\s*\)', re.IGNORECASE)
+_WHITESPACE = re.compile(r'\s+')
+
+
+def statement_shape(statement):
+    """
+      Reduces a SQL statement to its shape by replacing bind placeholders
+      and literals with ? and collapsing IN lists and whitespace, so that
+      the same query issued with different parameters counts as a repeat.
+    """
+
+    shape = _PLACEHOLDER.sub('?', statement)
+    shape = _STRING_LITERAL.sub('?', shape)
+    shape = _NUMBER_LITERAL.sub('?', shape)
+    shape = _IN_LIST.sub('IN (?)', shape)
+    return _WHITESPACE.sub(' ', shape).strip()
+
+
+class SQLProfiler(object):
+    """
+      Opt-in per-request SQL instrumentation.
+
+      Enabled by the SQL_PROFILER_ENABLED config value or the SQL_PROFILER=1
+      environment variable. For every request it records the time spent in
+      SQL statements and how often each statement shape repeated, then adds
+      a Server-Timing header and logs one line with them and the statement
+      count kept by logs.count_queries(). A shape
+      repeated at least SQL_PROFILER_N_PLUS_ONE_THRESHOLD times is reported
+      as a likely N+1 pattern, e.g. lazy loads issued from a loop.
+    """
+
+    def __init__(self, app=None):
+        self.threshold = 5
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        enabled = app.config.get(
+            'SQL_PROFILER_ENABLED', os.environ.get('SQL_PROFILER') == '1')
+
+        if not enabled:
+            return
+
+        self.threshold = app.config.get(
+            'SQL_PROFILER_N_PLUS_ONE_THRESHOLD', self.threshold)
+
+        if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+            event.listen(Engine, 'handle_error', _handle_error)
+
+        # outside debug mode Flask's logger only passes warnings on, which
+        # would drop the per-request summary line
+        if app.logger.getEffectiveLevel() > logging.INFO:
+            app.logger.setLevel(logging.INFO)
+
+        count_queries(app)
+        app.before_request(_start_profile)
+        app.after_request(self._finish_profile(app))
+
+    def _finish_profile(self, app):
+
+        def finish_profile(response):
+            profile = g.pop('sql_profile', None)
+
+            if profile is None:
+                return response
+
+            sql_count = g.get('sql_count', 0)
+            duration_ms = profile['duration'] * 1000
+            repeated = [(shape, count) for shape, count in profile['shapes'].most_common()
+                        if count >= self.threshold]
+
+            response.headers.add(
+                'Server-Timing',
+                'db;dur={:.2f};desc="{} queries"'.format(duration_ms, sql_count))
+
+            app.logger.info(
+                'sql profile: %d queries, %.2f ms', sql_count, duration_ms,
+                extra={'sql_count': sql_count, 'sql_ms': round(duration_ms, 2)})
+
+            for shape, count in repeated:
+                app.logger.warning(
+                    'possible N+1: statement repeated %d times: %s', count, shape,
+                    extra={'sql_repeats': count, 'sql_shape': shape})
+
+            return response
+
+        return finish_profile
+
+
+def _start_profile():
+    g.sql_profile = {'duration': 0.0, 'shapes': Counter()}
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and 'sql_profile' in g:
+        conn.info.setdefault('sql_profile_started', []).append(time.perf_counter())
+
+
+def _record_statement(conn, statement):
+    started = conn.info.get('sql_profile_started')
+
+    if not started:
+        return
+
+    elapsed = time.perf_counter() - started.pop()
+
+    if has_request_context() and 'sql_profile' in g:
+        profile = g.sql_profile
+        profile['duration'] += elapsed
+        profile['shapes'][statement_shape(statement)] += 1
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    _record_statement(conn, statement)
+
+
+def _handle_error(context):
+    # a failed statement never reaches after_cursor_execute; without this
+    # its start time would stay on the pooled connection and be paired with
+    # the connection's next statement
+    if context.connection is not None and context.statement is not None:
+        _record_statement(context.connection, context.statement)
@@ -0,0 +1,56 @@
+class ArtistRow(object):
+    """
+      One entry of the /artists listing.
+    """
+
+    __slots__ = ('id', 'name')
+
+    def __init__(self, id, name):
+        self.id = id
+        self.name = name
+
+
+class VenueRow(object):
+    """
+      One venue of the /venues city/state tree.
+    """
+
+    __slots__ = ('id', 'name', 'city', 'state', 'num_upcoming_shows')
+
+    def __init__(self, id, name, city, state, num_upcoming_shows):
+        self.id = id
+        self.name = name
+        self.city = city
+        self.state = state
+        self.num_upcoming_shows = num_upcoming_shows
+
+
+class ShowRow(object):
+    """
+      One tile of the /shows listing.
+    """
+
+    __slots__ = ('start_time', 'venue_id', 'artist_id', 'venue_name', 'artist_name',
+                 'artist_image_link')
+
+    def __init__(self, start_time, venue_id, artist_id, venue_name, artist_name,
+                 artist_image_link):
+        self.start_time = start_time
+        self.venue_id = venue_id
+        self.artist_id = artist_id
+        self.venue_name = venue_name
+        self.artist_name = artist_name
+        self.artist_image_link = artist_image_link
+
+
+def fetch(connection, statement, row_class):
+    """
+      Executes a Core select and wraps every row in row_class, whose
+      constructor takes the selected columns in order.
+
+      List pages only render a few columns, so going through Core instead of
+      an ORM query skips entity construction, identity map bookkeeping and
+      the per-row keyed tuples, and the __slots__ rows carry no __dict__.
+    """
+
+    return [row_class(*row) for row in connection.execute(statement)]
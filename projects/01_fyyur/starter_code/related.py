@@ -0,0 +1,130 @@
+import hashlib
+import heapq
+import random
+from collections import defaultdict
+
+# 16 bands of 4 rows: pairs with a Jaccard similarity around 0.5 and up
+# share at least one band with high probability
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+
+# Mersenne prime modulus of the (a * x + b) % PRIME permutations
+PRIME = (1 << 61) - 1
+
+_rng = random.Random(7)
+_PERMUTATIONS = [(_rng.randrange(1, PRIME), _rng.randrange(PRIME)) for _ in range(NUM_PERM)]
+
+
+def _hash64(value):
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), 'big')
+
+
+def features(genres, city, state):
+    """
+      Returns the token set compared between venues and artists: one token
+      per genre, plus the city and the state.
+    """
+
+    tokens = set('genre:' + genre.lower() for genre in genres or ())
+    tokens.add('city:{}|{}'.format((city or '').strip().lower(), (state or '').upper()))
+    tokens.add('state:' + (state or '').upper())
+    return frozenset(tokens)
+
+
+def jaccard(a, b):
+    if not a and not b:
+        return 0.0
+    return float(len(a & b)) / len(a | b)
+
+
+def signature(tokens):
+    hashes = [_hash64(token) for token in tokens]
+    return [min((a * h + b) % PRIME for h in hashes) for a, b in _PERMUTATIONS]
+
+
+def band_keys(sig):
+    """
+      Returns one signed 64-bit key per band of the signature, as stored in
+      the indexed band_key column.
+    """
+
+    keys = []
+
+    for band in range(BANDS):
+        rows = sig[band * ROWS:(band + 1) * ROWS]
+        digest = hashlib.blake2b('{}:{}'.format(band, ','.join(map(str, rows))).encode(),
+                                 digest_size=8).digest()
+        keys.append(int.from_bytes(digest, 'big', signed=True))
+
+    return keys
+
+
+def top_neighbours(key, tokens, candidates, top_k):
+    """
+      Scores the candidates, a mapping of (kind, id) to token sets, against
+      tokens by exact Jaccard similarity and returns the top_k best of each
+      kind as (kind, id, score) triples, best first. key itself is skipped.
+    """
+
+    by_kind = defaultdict(list)
+
+    for candidate, candidate_tokens in candidates.items():
+        if candidate == key:
+            continue
+
+        score = jaccard(tokens, candidate_tokens)
+
+        if score > 0:
+            by_kind[candidate[0]].append((score, -candidate[1], candidate))
+
+    neighbours = []
+
+    for kind in sorted(by_kind):
+        for score, _, candidate in heapq.nlargest(top_k, by_kind[kind]):
+            neighbours.append((candidate[0], candidate[1], score))
+
+    return neighbours
+
+
+def build(entities, top_k, max_bucket):
+    """
+      Computes the neighbour lists of every entity in entities, a mapping of
+      (kind, id) to token sets.
+
+      Entities are bucketed by the bands of their MinHash signature and only
+      entities sharing a bucket are compared, instead of every pair. A
+      bucket of identical or near identical token sets can hold thousands
+      of entities, so every member of a bucket is only compared with its
+      first max_bucket members, lowest ids first.
+
+      Returns the (kind, id, band_key) bucket rows and the (kind, id,
+      related_kind, related_id, score) neighbour rows.
+    """
+
+    buckets = defaultdict(list)
+    bucket_rows = []
+
+    for key in sorted(entities):
+        for band_key in band_keys(signature(entities[key])):
+            buckets[band_key].append(key)
+            bucket_rows.append((key[0], key[1], band_key))
+
+    candidates = defaultdict(set)
+
+    for members in buckets.values():
+        sample = members[:max_bucket]
+
+        for member in members:
+            candidates[member].update(sample)
+
+    related_rows = []
+
+    for key, tokens in entities.items():
+        neighbours = top_neighbours(
+            key, tokens, dict((c, entities[c]) for c in candidates.get(key, ())), top_k)
+
+        for kind, entity_id, score in neighbours:
+            related_rows.append((key[0], key[1], kind, entity_id, score))
+
+    return bucket_rows, related_rows
@@ -0,0 +1,547 @@
+import base64
+import datetime
+import json
+import os
+import re
+import unittest
+from unittest import mock
+
+from sqlalchemy import event, exc
+
+import importer
+import partitions
+from app import Artist, Show, Venue, _rollover_shows, _update_changed_columns, app, db, prefix_cache, response_cache
+
+# the parent or a monthly partition; the empty default partition may be
+# scanned sequentially
+SHOWS_SEQ_SCAN = re.compile(r'Seq Scan on "Shows(_y\d{4}m\d{2})?"')
+
+
+class DatabaseTestCase(unittest.TestCase):
+    """
+      Creates the schema in the test database, with monthly Shows
+      partitions from 100 days ago to about three months ahead, and drops
+      it again afterwards.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get(
+            'FYYUR_TEST_DATABASE_URL', 'postgresql://postgres@localhost:5432/fyyur_test')
+        app.config['WTF_CSRF_ENABLED'] = False
+        app.config['RESPONSE_CACHE_MAX_ENTRIES'] = 0
+        app.config['AUTOCOMPLETE_CACHE_MAX_ENTRIES'] = 0
+
+        response_cache.init_app(app)
+        prefix_cache.init_app(app)
+
+        with app.app_context():
+            db.session.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+            db.session.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+            db.session.commit()
+            db.drop_all()
+            db.create_all()
+
+            cls.first_month = partitions.month_start(datetime.datetime.now() - datetime.timedelta(days=100))
+            partitions.create_partitions(db.session.connection(), cls.first_month, 7)
+            db.session.commit()
+
+    @classmethod
+    def tearDownClass(cls):
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def setUp(self):
+        self.client = app.test_client
+
+
+class ShowIndexTestCase(DatabaseTestCase):
+    """
+      Checks that the routes filtering Shows by venue, artist and time window
+      are served by indexes on a seeded dataset large enough for the planner
+      to prefer them.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super(ShowIndexTestCase, cls).setUpClass()
+
+        # the seeded shows span from 100 days ago to 39 days ahead
+        with app.app_context():
+            db.session.execute('''
+                INSERT INTO "Venues" (name, city, state, address, genres)
+                SELECT 'Venue ' || g, 'City ' || (g % 500), 'CA', g || ' Main St', '{Jazz}'
+                FROM generate_series(1, 20000) g
+            ''')
+            db.session.execute('''
+                INSERT INTO "Artists" (name, city, state, genres)
+                SELECT 'Artist ' || g, 'City ' || (g % 500), 'CA', '{Jazz}'
+                FROM generate_series(1, 20000) g
+            ''')
+            db.session.execute('''
+                INSERT INTO "Shows" (venue_id, artist_id, start_time, time_range, is_past)
+                SELECT (g % 20000) + 1, (g * 7 % 20000) + 1, t, tsrange(t, t + interval '2 hours'), t < now()
+                FROM generate_series(1, 200000) g,
+                    LATERAL (SELECT now()::timestamp - interval '100 days' + g * interval '1 minute' AS t) s
+            ''')
+            db.session.commit()
+            db.session.execute('ANALYZE')
+            db.session.commit()
+
+    def _explain_route(self, path, table='"Shows"'):
+        """
+          Requests path, then EXPLAINs every SELECT the request issued that
+          touches table and returns the plans.
+        """
+
+        statements = []
+
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            if statement.lstrip().upper().startswith('SELECT') and table in statement:
+                statements.append((statement, parameters))
+
+        with app.app_context():
+            engine = db.engine
+            event.listen(engine, 'before_cursor_execute', capture)
+
+            try:
+                res = self.client().get(path)
+            finally:
+                event.remove(engine, 'before_cursor_execute', capture)
+
+            self.assertEqual(res.status_code, 200)
+            self.assertTrue(statements)
+
+            plans = []
+
+            with engine.connect() as connection:
+                for statement, parameters in statements:
+                    rows = connection.execute('EXPLAIN ' + statement, parameters)
+                    plans.append('\n'.join(row[0] for row in rows))
+
+            return plans
+
+    def assertNoShowsSeqScan(self, path):
+        for plan in self._explain_route(path):
+            self.assertNotRegex(plan, SHOWS_SEQ_SCAN)
+
+    def test_show_venue_uses_index(self):
+        self.assertNoShowsSeqScan('/venues/42')
+
+    def test_show_artist_uses_index(self):
+        self.assertNoShowsSeqScan('/artists/42')
+
+    def test_shows_listing_uses_index(self):
+        self.assertNoShowsSeqScan('/shows')
+
+    def test_shows_from_skips_old_partitions(self):
+        oldest = partitions.partition_name(self.first_month)
+        today = datetime.date.today().isoformat()
+
+        for plan in self._explain_route('/shows?from=' + today):
+            self.assertNotIn(oldest, plan, plan)
+
+    def test_autocomplete_reads_names_in_index_order(self):
+        # "venue 1" matches over 11000 of the seeded names; only a limit's
+        # worth may be read, not all of them sorted
+        for plan in self._explain_route('/venues/autocomplete?q=Venue%201', '"Venues"'):
+            self.assertIn('ix_Venues_lower_name_pattern', plan)
+            self.assertNotRegex(plan, re.compile(r'(^|->)\s+Sort\s+\(', re.MULTILINE))
+
+    def test_shows_rejects_malformed_cursors(self):
+        for values in (['2026-01-01T20:00:00'], ['2026-01-01T20:00:00', 1, '2'],
+                       ['2026-01-01T20:00:00', 1, 2, 3], ['2026-01-01T20:00:00', 1.5, 2], ['soon', 1, 2]):
+            cursor = base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+            res = self.client().get('/shows', query_string={'after': cursor})
+
+            self.assertEqual(res.status_code, 400, values)
+
+
+class BookingTestCase(DatabaseTestCase):
+    """
+      Creates a venue and an artist for each test to book shows for.
+    """
+
+    def setUp(self):
+        super(BookingTestCase, self).setUp()
+
+        with app.app_context():
+            self.venue_id = db.session.execute(
+                "INSERT INTO \"Venues\" (name, city, state, address, genres) "
+                "VALUES ('Booking Venue', 'City', 'CA', '1 Main St', '{Jazz}') RETURNING id").scalar()
+            self.artist_id = db.session.execute(
+                "INSERT INTO \"Artists\" (name, city, state, genres) "
+                "VALUES ('Booking Artist', 'City', 'CA', '{Jazz}') RETURNING id").scalar()
+            db.session.commit()
+
+    def tearDown(self):
+        with app.app_context():
+            db.session.execute('DELETE FROM "Venues" WHERE id = :id', {'id': self.venue_id})
+            db.session.execute('DELETE FROM "Artists" WHERE id = :id', {'id': self.artist_id})
+            db.session.commit()
+
+    def _insert_show(self, start_time, minutes=120):
+        db.session.execute(
+            'INSERT INTO "Shows" (venue_id, artist_id, start_time, time_range, is_past) '
+            'VALUES (:venue_id, :artist_id, :start_time, '
+            "tsrange(:start_time, :start_time + :minutes * interval '1 minute'), false)",
+            {'venue_id': self.venue_id, 'artist_id': self.artist_id,
+             'start_time': start_time, 'minutes': minutes})
+
+
+class ShowOverlapTestCase(BookingTestCase):
+    """
+      Checks that an artist cannot be booked for overlapping shows, also when
+      they fall in different monthly partitions.
+    """
+
+    def test_overlap_across_month_boundary_is_rejected(self):
+        boundary = partitions.add_months(self.first_month, 5)
+
+        with app.app_context():
+            self._insert_show(boundary - datetime.timedelta(hours=1))
+            db.session.commit()
+
+            with self.assertRaises(exc.IntegrityError) as raised:
+                self._insert_show(boundary + datetime.timedelta(minutes=30))
+
+            self.assertEqual(raised.exception.orig.pgcode, '23P01')
+            db.session.rollback()
+
+    def test_adjacent_shows_across_month_boundary_are_accepted(self):
+        boundary = partitions.add_months(self.first_month, 5)
+
+        with app.app_context():
+            self._insert_show(boundary - datetime.timedelta(hours=1), minutes=60)
+            self._insert_show(boundary)
+            db.session.commit()
+
+
+class CacheInvalidationTestCase(BookingTestCase):
+    """
+      Checks that the write handlers drop the cached pages showing what
+      they changed.
+    """
+
+    def test_create_show_invalidates_venue_and_listings(self):
+        start_time = partitions.add_months(self.first_month, 5) + datetime.timedelta(days=2, hours=20)
+
+        with mock.patch.object(response_cache, 'invalidate') as invalidate:
+            res = self.client().post('/shows/create', data={
+                'venue_id': self.venue_id,
+                'artist_id': self.artist_id,
+                'start_time': start_time.strftime('%Y-%m-%d %H:%M:%S')
+            })
+
+        self.assertEqual(res.status_code, 302)
+        invalidate.assert_called_once()
+        self.assertEqual(set(invalidate.call_args[0]), {'venues', 'venue:' + str(self.venue_id), 'shows'})
+
+
+class EditConflictTestCase(BookingTestCase):
+    """
+      Checks the optimistic concurrency control of the venue edit form.
+    """
+
+    def setUp(self):
+        super(EditConflictTestCase, self).setUp()
+
+        self.form = {
+            'name': 'Booking Venue',
+            'city': 'City',
+            'state': 'CA',
+            'address': '1 Main St',
+            'phone': '555-000-0000',
+            'genres': 'Jazz',
+            'facebook_link': 'https://www.facebook.com/bookingvenue',
+            'website': 'https://bookingvenue.example.com',
+            'image_link': 'https://images.example.com/bookingvenue.jpg',
+            'seeking_description': ''
+        }
+
+        with app.app_context():
+            db.session.execute(
+                'UPDATE "Venues" SET phone = :phone, facebook_link = :facebook_link, website = :website, '
+                'image_link = :image_link, seeking_talent = false, seeking_description = :seeking_description '
+                'WHERE id = :id', dict(self.form, id=self.venue_id))
+            db.session.commit()
+
+    def _venue(self):
+        with app.app_context():
+            return db.session.execute(
+                'SELECT phone, version FROM "Venues" WHERE id = :id', {'id': self.venue_id}).first()
+
+    def test_stale_version_is_rejected(self):
+        with app.app_context():
+            venue = Venue.query.get(self.venue_id)
+            self.assertIsNone(_update_changed_columns(Venue, venue, {'phone': '555-111-1111'}, 0))
+            db.session.rollback()
+
+        client = self.client()
+        res = client.post('/venues/{}/edit'.format(self.venue_id),
+                          data=dict(self.form, phone='555-111-1111', version=0))
+
+        self.assertEqual(res.status_code, 302)
+        self.assertTrue(res.headers['Location'].endswith('/venues/{}/edit'.format(self.venue_id)))
+
+        with client.session_transaction() as sess:
+            self.assertIn('edited by someone else', sess['_flashes'][0][1])
+
+        self.assertEqual(tuple(self._venue()), ('555-000-0000', 1))
+
+    def test_update_sets_only_changed_columns(self):
+        updates = []
+
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            if statement.lstrip().upper().startswith('UPDATE "VENUES"'):
+                updates.append(statement)
+
+        with app.app_context():
+            engine = db.engine
+            event.listen(engine, 'before_cursor_execute', capture)
+
+            try:
+                res = self.client().post('/venues/{}/edit'.format(self.venue_id),
+                                         data=dict(self.form, phone='555-111-1111', version=1))
+            finally:
+                event.remove(engine, 'before_cursor_execute', capture)
+
+        self.assertEqual(res.status_code, 302)
+        self.assertEqual(len(updates), 1)
+
+        assignments = updates[0].split(' SET ', 1)[1].split(' WHERE ', 1)[0]
+        self.assertEqual(sorted(a.split('=')[0].strip() for a in assignments.split(',')),
+                         ['phone', 'updated_at', 'version'])
+        self.assertEqual(tuple(self._venue()), ('555-111-1111', 2))
+
+
+class ShowPartitionTestCase(BookingTestCase):
+    """
+      Checks that partitions can be created for months whose shows already
+      landed in the default partition.
+    """
+
+    def _partition_of(self, start_time):
+        return db.session.execute(
+            'SELECT tableoid::regclass::text FROM "Shows" WHERE artist_id = :artist_id AND start_time = :start_time',
+            {'artist_id': self.artist_id, 'start_time': start_time}).scalar()
+
+    def test_create_partitions_moves_shows_out_of_default(self):
+        month = partitions.add_months(self.first_month, 8)
+        start_time = month + datetime.timedelta(days=3, hours=20)
+
+        with app.app_context():
+            self._insert_show(start_time)
+            db.session.commit()
+            self.assertEqual(self._partition_of(start_time), '"{}"'.format(partitions.DEFAULT_PARTITION))
+
+            created = partitions.create_partitions(db.session.connection(), month, 1)
+            db.session.commit()
+
+            self.assertEqual(created, [partitions.partition_name(month)])
+            self.assertEqual(self._partition_of(start_time), '"{}"'.format(partitions.partition_name(month)))
+
+
+class ChangesTestCase(DatabaseTestCase):
+    """
+      Checks that /changes pages through upserts and deletions with its
+      cursor and holds back changes younger than the safety lag.
+    """
+
+    def setUp(self):
+        super(ChangesTestCase, self).setUp()
+        self.lag = app.config['CHANGES_SAFETY_LAG_SECONDS']
+        app.config['CHANGES_SAFETY_LAG_SECONDS'] = 0
+
+        with app.app_context():
+            db.session.execute('DELETE FROM "Tombstones"')
+            db.session.execute('DELETE FROM "Venues"')
+            self.venue_ids = [row[0] for row in db.session.execute('''
+                INSERT INTO "Venues" (name, city, state, address)
+                SELECT 'Venue ' || g, 'City', 'CA', g || ' Main St' FROM generate_series(1, 3) g
+                RETURNING id
+            ''')]
+            db.session.commit()
+
+    def tearDown(self):
+        app.config['CHANGES_SAFETY_LAG_SECONDS'] = self.lag
+
+    def _changes(self, since=None, limit=None):
+        query = {}
+
+        if since is not None:
+            query['since'] = since
+
+        if limit is not None:
+            query['limit'] = limit
+
+        res = self.client().get('/changes', query_string=query)
+        self.assertEqual(res.status_code, 200)
+        return res.get_json()
+
+    def test_cursor_pages_through_changes_and_tombstones(self):
+        seen = []
+        cursor = None
+
+        while True:
+            page = self._changes(cursor, limit=2)
+            seen.extend((change['kind'], change['key'], change['op']) for change in page['changes'])
+            cursor = page['cursor']
+
+            if not page['has_more']:
+                break
+
+        # the venues share changed_at, so they are ordered by their keys as text
+        self.assertEqual(seen, [('venue', key, 'upsert') for key in sorted(str(i) for i in self.venue_ids)])
+
+        self.client().get('/venues/{}/delete'.format(self.venue_ids[0]))
+
+        page = self._changes(cursor)
+        self.assertEqual([(change['kind'], change['key'], change['op']) for change in page['changes']],
+                         [('venue', str(self.venue_ids[0]), 'delete')])
+        self.assertIsNone(page['changes'][0]['data'])
+
+        # nothing new: the client keeps its cursor
+        self.assertEqual(self._changes(page['cursor'])['changes'], [])
+        self.assertEqual(self._changes(page['cursor'])['cursor'], page['cursor'])
+
+    def test_changes_rejects_malformed_cursors(self):
+        for values in (['2026-01-01T20:00:00', 'venue'], ['2026-01-01T20:00:00', 1, 2],
+                       ['2026-01-01T20:00:00', 'venue', 2], ['2026-01-01T20:00:00', 'venue', '1', 'x'],
+                       ['soon', 'venue', '1']):
+            cursor = base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+            res = self.client().get('/changes', query_string={'since': cursor})
+
+            self.assertEqual(res.status_code, 400, values)
+
+    def test_changes_younger_than_the_lag_are_held_back(self):
+        app.config['CHANGES_SAFETY_LAG_SECONDS'] = 3600
+
+        self.assertEqual(self._changes()['changes'], [])
+
+
+class BulkDeleteTestCase(BookingTestCase):
+    """
+      Checks the JSON bulk delete endpoints with CSRF protection enabled.
+    """
+
+    def setUp(self):
+        super(BulkDeleteTestCase, self).setUp()
+        app.config['WTF_CSRF_ENABLED'] = True
+
+    def tearDown(self):
+        app.config['WTF_CSRF_ENABLED'] = False
+        super(BulkDeleteTestCase, self).tearDown()
+
+    def test_bulk_delete_requires_a_csrf_token(self):
+        client = self.client()
+
+        res = client.post('/venues/delete', json={'ids': [self.venue_id]})
+        self.assertEqual(res.status_code, 400)
+
+        token = client.get('/csrf-token').get_json()['csrf_token']
+
+        res = client.post('/venues/delete', json={'ids': [self.venue_id]}, headers={'X-CSRFToken': token})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.get_json()['deleted'], 1)
+
+        res = client.post('/artists/delete', json={'ids': [self.artist_id]}, headers={'X-CSRFToken': token})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.get_json()['deleted'], 1)
+
+
+class ShowCounterTestCase(BookingTestCase):
+    """
+      Checks that the stored upcoming/past show counters stay in step with
+      the Shows table through rollover, cascading and bulk deletes.
+    """
+
+    def _create_show(self, venue_id, artist_id, start_time):
+        res = self.client().post('/shows/create', data={
+            'venue_id': venue_id,
+            'artist_id': artist_id,
+            'start_time': start_time.strftime('%Y-%m-%d %H:%M:%S')
+        })
+        self.assertEqual(res.status_code, 302)
+
+    def _counters(self, table, id):
+        return tuple(db.session.execute(
+            'SELECT upcoming_shows_count, past_shows_count FROM "{}" WHERE id = :id'.format(table),
+            {'id': id}).first())
+
+    def test_counters_match_after_rollover_and_deletes(self):
+        start_time = partitions.add_months(self.first_month, 5) + datetime.timedelta(days=4, hours=20)
+        past_start_time = partitions.add_months(self.first_month, 1) + datetime.timedelta(hours=20)
+
+        self._create_show(self.venue_id, self.artist_id, start_time)
+
+        with app.app_context():
+            # the show's start_time passes
+            db.session.execute(
+                'UPDATE "Shows" SET start_time = :start_time, '
+                "time_range = tsrange(:start_time, :start_time + interval '2 hours') "
+                'WHERE venue_id = :venue_id',
+                {'start_time': past_start_time, 'venue_id': self.venue_id})
+            db.session.commit()
+            self.assertEqual(len(_rollover_shows()), 1)
+
+            other_venue_id = db.session.execute(
+                "INSERT INTO \"Venues\" (name, city, state, address, genres) "
+                "VALUES ('Cascade Venue', 'City', 'CA', '2 Main St', '{Jazz}') RETURNING id").scalar()
+            other_artist_id = db.session.execute(
+                "INSERT INTO \"Artists\" (name, city, state, genres) "
+                "VALUES ('Bulk Artist', 'City', 'CA', '{Jazz}') RETURNING id").scalar()
+            db.session.commit()
+
+        self._create_show(other_venue_id, self.artist_id, start_time + datetime.timedelta(days=1))
+        self._create_show(self.venue_id, other_artist_id, start_time + datetime.timedelta(days=2))
+
+        # the venue's show goes with it through ON DELETE CASCADE
+        self.client().get('/venues/{}/delete'.format(other_venue_id))
+
+        res = self.client().post('/artists/delete', json={'ids': [other_artist_id]})
+        self.assertEqual(res.status_code, 200)
+
+        with app.app_context():
+            self.assertEqual(self._counters('Venues', self.venue_id), (0, 1))
+            self.assertEqual(self._counters('Artists', self.artist_id), (0, 1))
+
+        res = app.test_cli_runner().invoke(args=['check-show-counters'])
+
+        self.assertEqual(res.exit_code, 0, res.output)
+        self.assertIn('0 mismatched rows', res.output)
+
+
+class ImportTestCase(BookingTestCase):
+    """
+      Checks that the importer skips bad show records instead of aborting.
+    """
+
+    def test_bad_shows_are_rejected_and_the_rest_imported(self):
+        start_time = partitions.add_months(self.first_month, 5) + datetime.timedelta(days=3, hours=20)
+        records = [
+            {'venue_id': self.venue_id, 'artist_id': self.artist_id, 'start_time': start_time.isoformat()},
+            {'venue_id': self.venue_id, 'artist_id': self.artist_id, 'start_time': 'soon'},
+            {'venue_id': self.venue_id + 1000, 'artist_id': self.artist_id,
+             'start_time': (start_time + datetime.timedelta(days=1)).isoformat()},
+        ]
+        tables = {'venues': Venue.__table__, 'artists': Artist.__table__, 'shows': Show.__table__}
+        rejected = []
+
+        with app.app_context():
+            read, written, elapsed = importer.import_records(
+                db.engine, tables, 'shows', records, batch_size=2,
+                rejected=lambda number, reason: rejected.append((number, reason)))
+
+            upcoming = db.session.execute('SELECT upcoming_shows_count FROM "Venues" WHERE id = :id',
+                                          {'id': self.venue_id}).scalar()
+
+        self.assertEqual((read, written), (3, 1))
+        self.assertEqual([number for number, reason in rejected], [2, 3])
+        self.assertEqual(rejected[1][1], 'unknown venue_id {}'.format(self.venue_id + 1000))
+        self.assertEqual(upcoming, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,170 @@
+import unittest
+from unittest import mock
+
+from flask import Flask
+from flask_wtf.csrf import generate_csrf
+
+from cache import CSRF_PLACEHOLDER, PrefixCache, ResponseCache
+
+
+class ResponseCacheTestCase(unittest.TestCase):
+    """
+      Checks the rendered page cache on a bare Flask app, without a
+      database.
+    """
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['SECRET_KEY'] = 'test'
+        self.app.config['RESPONSE_CACHE_MAX_ENTRIES'] = 2
+        self.app.config['RESPONSE_CACHE_TTL'] = 60
+        self.cache = ResponseCache(self.app)
+        self.renders = []
+
+        @self.app.route('/venues/<int:venue_id>')
+        @self.cache.cached('venues', 'venue:{venue_id}')
+        def show_venue(venue_id):
+            self.renders.append(venue_id)
+            return 'venue {} csrf {}'.format(venue_id, generate_csrf())
+
+        self.client = self.app.test_client()
+
+    def _get(self, venue_id, client=None):
+        res = (client or self.client).get('/venues/{}'.format(venue_id))
+        self.assertEqual(res.status_code, 200)
+        return res.get_data()
+
+    def test_second_request_is_served_from_the_cache(self):
+        first = self._get(1)
+        second = self._get(1)
+
+        self.assertEqual(first, second)
+        self.assertEqual(self.renders, [1])
+        self.assertEqual(self.cache.stats()['hits'], 1)
+        self.assertEqual(self.cache.stats()['misses'], 1)
+        self.assertEqual(self.cache.stats()['entries'], 1)
+        self.assertEqual(self.cache.stats()['hit_rate'], 0.5)
+
+    def test_invalidate_drops_the_entries_of_a_tag(self):
+        self._get(1)
+        self._get(2)
+
+        self.cache.invalidate('venue:1')
+        self._get(1)
+        self._get(2)
+        self.assertEqual(self.renders, [1, 2, 1])
+
+        self.cache.invalidate('venues')
+        self._get(1)
+        self._get(2)
+        self.assertEqual(self.renders, [1, 2, 1, 1, 2])
+        self.assertEqual(self.cache.stats()['invalidations'], 3)
+
+    def test_entries_expire_after_the_ttl(self):
+        with mock.patch('cache.time.time', return_value=1000.0):
+            self._get(1)
+
+        with mock.patch('cache.time.time', return_value=1059.0):
+            self._get(1)
+
+        self.assertEqual(self.renders, [1])
+
+        with mock.patch('cache.time.time', return_value=1061.0):
+            self._get(1)
+
+        self.assertEqual(self.renders, [1, 1])
+
+    def test_least_recently_used_entry_is_evicted(self):
+        self._get(1)
+        self._get(2)
+        self._get(1)
+        self._get(3)
+
+        self._get(1)
+        self._get(2)
+
+        self.assertEqual(self.renders, [1, 2, 3, 2])
+        self.assertEqual(self.cache.stats()['entries'], 2)
+        self.assertEqual(self.cache.stats()['evictions'], 2)
+
+    def test_each_session_gets_its_own_csrf_token(self):
+        other = self.app.test_client()
+
+        first = self._get(1)
+        second = self._get(1, other)
+
+        self.assertEqual(self.renders, [1])
+        self.assertNotEqual(first, second)
+        self.assertNotIn(CSRF_PLACEHOLDER, second)
+
+        # the stored body carries the placeholder instead of a token
+        self.assertEqual(self.cache._get('/venues/1?')[0], b'venue 1 csrf ' + CSRF_PLACEHOLDER)
+
+    def test_pending_flashes_bypass_the_cache(self):
+        self._get(1)
+
+        with self.client.session_transaction() as sess:
+            sess['_flashes'] = [('message', 'Venue 1 was edited!')]
+
+        self._get(1)
+
+        self.assertEqual(self.renders, [1, 1])
+        self.assertEqual(self.cache.stats()['hits'], 0)
+
+    def test_disabled_cache_stores_nothing(self):
+        self.cache.max_entries = 0
+
+        self._get(1)
+        self._get(1)
+
+        self.assertEqual(self.renders, [1, 1])
+        self.assertEqual(self.cache.stats()['entries'], 0)
+
+
+class PrefixCacheTestCase(unittest.TestCase):
+    """
+      Checks the autocomplete result cache.
+    """
+
+    def setUp(self):
+        self.cache = PrefixCache()
+        self.cache.max_entries = 2
+
+    def test_entries_are_kept_per_tag(self):
+        self.cache.set('venue-names', ('the', 10), [{'id': 1, 'name': 'The Hop'}])
+
+        self.assertEqual(self.cache.get('venue-names', ('the', 10)), [{'id': 1, 'name': 'The Hop'}])
+        self.assertIsNone(self.cache.get('artist-names', ('the', 10)))
+        self.assertEqual(self.cache.stats()['hits'], 1)
+        self.assertEqual(self.cache.stats()['misses'], 1)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        self.cache.set('venue-names', ('a', 10), [])
+        self.cache.set('venue-names', ('b', 10), [])
+        self.cache.get('venue-names', ('a', 10))
+        self.cache.set('venue-names', ('c', 10), [])
+
+        self.assertEqual(self.cache.get('venue-names', ('a', 10)), [])
+        self.assertIsNone(self.cache.get('venue-names', ('b', 10)))
+
+    def test_entries_expire_after_the_ttl(self):
+        with mock.patch('cache.time.time', return_value=1000.0):
+            self.cache.set('venue-names', ('a', 10), [])
+
+        with mock.patch('cache.time.time', return_value=1000.0 + self.cache.ttl + 1):
+            self.assertIsNone(self.cache.get('venue-names', ('a', 10)))
+
+    def test_linked_response_cache_invalidates_tags(self):
+        response_cache = ResponseCache()
+        response_cache.link(self.cache)
+        self.cache.set('venue-names', ('a', 10), [])
+        self.cache.set('artist-names', ('a', 10), [])
+
+        response_cache.invalidate('genres', 'venue-names')
+
+        self.assertIsNone(self.cache.get('venue-names', ('a', 10)))
+        self.assertEqual(self.cache.get('artist-names', ('a', 10)), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+import math
+import random
+import unittest
+
+import geo
+
+
+def _destination(latitude, longitude, bearing, km):
+    # the point km away from the given one in the direction of bearing
+    phi1, lambda1 = math.radians(latitude), math.radians(longitude)
+    theta, delta = math.radians(bearing), km / geo.EARTH_RADIUS_KM
+
+    phi2 = math.asin(math.sin(phi1) * math.cos(delta) + math.cos(phi1) * math.sin(delta) * math.cos(theta))
+    lambda2 = lambda1 + math.atan2(math.sin(theta) * math.sin(delta) * math.cos(phi1),
+                                   math.cos(delta) - math.sin(phi1) * math.sin(phi2))
+
+    return math.degrees(phi2), (math.degrees(lambda2) + 540) % 360 - 180
+
+
+class GridTestCase(unittest.TestCase):
+    """
+      Checks that the grid cell ranges searched by /venues/near cover every
+      point within the requested distance.
+    """
+
+    CENTERS = [
+        (37.7749, -122.4194),
+        (0.0, 0.0),
+        (-33.8688, 151.2093),
+        # across the antimeridian
+        (65.0, 179.95),
+        (-16.5, -179.99),
+        (0.0, 180.0),
+        (0.0, -180.0),
+        # the box reaches a pole
+        (89.9, 10.0),
+        (-89.95, -120.0),
+        (90.0, 0.0),
+        # on cell edges
+        (45.0, 10.0),
+        (-45.1, -0.1),
+    ]
+
+    def assertCovered(self, latitude, longitude, km, samples=500):
+        ranges = [cell_range for box in geo.bounding_boxes(latitude, longitude, km)
+                  for cell_range in geo.cell_ranges(box)]
+        rng = random.Random('{},{},{}'.format(latitude, longitude, km))
+
+        points = [_destination(latitude, longitude, bearing, km * 0.999) for bearing in range(0, 360, 5)]
+        points += [_destination(latitude, longitude, rng.uniform(0, 360), km * math.sqrt(rng.random()))
+                   for _ in range(samples)]
+
+        for point_latitude, point_longitude in points:
+            self.assertLessEqual(geo.distance_km(latitude, longitude, point_latitude, point_longitude), km)
+
+            cell = geo.grid_cell(point_latitude, point_longitude)
+            self.assertTrue(any(first <= cell <= last for first, last in ranges),
+                            '{} km from {}: {} not covered'.format(
+                                km, (latitude, longitude), (point_latitude, point_longitude)))
+
+    def test_points_within_distance_are_covered(self):
+        for latitude, longitude in self.CENTERS:
+            for km in (1, 10, 50, 250):
+                self.assertCovered(latitude, longitude, km)
+
+    def test_grid_cell_bounds(self):
+        self.assertEqual(geo.grid_cell(-90, -180), 0)
+        self.assertEqual(geo.grid_cell(90, 180), geo.LATITUDE_CELLS * geo.LONGITUDE_CELLS - 1)
+        self.assertEqual(geo.grid_cell(0.05, 0.05) - geo.grid_cell(0.05, -0.05), 1)
+        self.assertEqual(geo.grid_cell(0.05, 0.05) - geo.grid_cell(-0.05, 0.05), geo.LONGITUDE_CELLS)
+
+    def test_box_is_split_at_the_antimeridian(self):
+        boxes = geo.bounding_boxes(0.0, 179.95, 50)
+
+        self.assertEqual(len(boxes), 2)
+        self.assertEqual(boxes[0][3], 180.0)
+        self.assertEqual(boxes[1][2], -180.0)
+
+    def test_box_spans_all_longitudes_at_a_pole(self):
+        boxes = geo.bounding_boxes(89.9, 10.0, 50)
+
+        self.assertEqual(boxes, [(boxes[0][0], 90.0, -180.0, 180.0)])
+
+    def test_distance_km(self):
+        self.assertAlmostEqual(geo.distance_km(0, 0, 0, 1), 111.195, places=2)
+        self.assertAlmostEqual(geo.distance_km(0, 179.5, 0, -179.5), 111.195, places=2)
+        self.assertEqual(geo.distance_km(12.5, 45.0, 12.5, 45.0), 0.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
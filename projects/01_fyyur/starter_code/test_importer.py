@@ -0,0 +1,81 @@
+import datetime
+import unittest
+
+import importer
+
+
+class ConvertTestCase(unittest.TestCase):
+    """
+      Checks the coercion of raw CSV and NDJSON records to table rows.
+    """
+
+    def test_csv_cells_are_coerced(self):
+        row = importer.convert('venues', {
+            'name': 'The Hop', 'city': 'Oakland', 'state': 'CA', 'address': '',
+            'seeking_talent': 'Yes', 'genres': '{Jazz, Folk}', 'unknown': 'ignored'})
+
+        self.assertIsNone(row['address'])
+        self.assertIs(row['seeking_talent'], True)
+        self.assertEqual(row['genres'], ['Jazz', 'Folk'])
+        self.assertNotIn('unknown', row)
+
+    def test_missing_genres_become_an_empty_list(self):
+        self.assertEqual(importer.convert('artists', {'name': 'Band', 'genres': ''})['genres'], [])
+        self.assertEqual(importer.convert('artists', {'name': 'Band', 'genres': '["Rock"]'})['genres'], ['Rock'])
+
+    def test_show_values_are_parsed(self):
+        row = importer.convert('shows', {
+            'venue_id': '3', 'artist_id': 4, 'start_time': '2026-05-21 21:30:00', 'duration': ''})
+
+        self.assertEqual(row, {'venue_id': 3, 'artist_id': 4,
+                               'start_time': datetime.datetime(2026, 5, 21, 21, 30), 'duration': None})
+
+    def test_unusable_shows_are_refused(self):
+        show = {'venue_id': '3', 'artist_id': '4', 'start_time': '2026-05-21 21:30:00'}
+
+        for changes in ({'venue_id': 'three'}, {'start_time': 'soon'}, {'start_time': ''},
+                        {'artist_id': None}, {'start_time': '2026-05-21T21:30:00Z'},
+                        {'duration': '0'}):
+            with self.assertRaises(ValueError, msg=changes):
+                importer.convert('shows', dict(show, **changes))
+
+    def test_convert_all_hands_refused_records_to_rejected(self):
+        rejected = []
+        records = [{'venue_id': '1', 'artist_id': '1', 'start_time': '2026-05-21 21:30:00'},
+                   {'venue_id': '1', 'artist_id': '1', 'start_time': 'soon'},
+                   {'venue_id': '1', 'artist_id': '2', 'start_time': '2026-05-21 21:30:00'}]
+
+        converted = list(importer._convert_all('shows', records, lambda *args: rejected.append(args)))
+
+        self.assertEqual([number for number, row in converted], [1, 3])
+        self.assertEqual([number for number, reason in rejected], [2])
+
+
+class DedupeTestCase(unittest.TestCase):
+    """
+      Checks that upsert batches touch each natural key only once.
+    """
+
+    COLUMNS = ('name', 'city', 'state', 'genres')
+
+    def _artist(self, name, phone, genres=('Rock',), city='Oakland'):
+        return {'name': name, 'city': city, 'state': 'CA', 'genres': list(genres), 'phone': phone}
+
+    def test_last_row_of_a_key_is_kept(self):
+        rows = [self._artist('Band', '1'), self._artist('Other', '2'), self._artist('Band', '3')]
+
+        self.assertEqual(importer._dedupe(rows, self.COLUMNS), rows[1:])
+
+    def test_genres_are_part_of_the_key(self):
+        rows = [self._artist('Band', '1'), self._artist('Band', '2', genres=('Jazz',))]
+
+        self.assertEqual(importer._dedupe(rows, self.COLUMNS), rows)
+
+    def test_rows_with_null_keys_are_all_kept(self):
+        rows = [self._artist('Band', '1', city=None), self._artist('Band', '2', city=None)]
+
+        self.assertEqual(importer._dedupe(rows, self.COLUMNS), rows)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,54 @@
+import logging
+import unittest
+
+from flask import Flask
+from sqlalchemy import create_engine, exc, text
+
+from profiler import SQLProfiler, statement_shape
+
+
+class SQLProfilerTestCase(unittest.TestCase):
+    """
+      Checks the SQL profiler on a bare Flask app and an in-memory SQLite
+      engine.
+    """
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['SQL_PROFILER_ENABLED'] = True
+        SQLProfiler(self.app)
+        self.engine = create_engine('sqlite://')
+        self.leftover = None
+
+        @self.app.route('/fail')
+        def fail():
+            with self.engine.connect() as connection:
+                try:
+                    connection.execute(text('SELECT * FROM missing'))
+                except exc.OperationalError:
+                    pass
+
+                self.leftover = list(connection.info.get('sql_profile_started', []))
+                connection.execute(text('SELECT 1'))
+
+            return ''
+
+    def test_failed_statement_leaves_no_start_time(self):
+        res = self.app.test_client().get('/fail')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(self.leftover, [])
+        self.assertIn('desc="2 queries"', res.headers['Server-Timing'])
+
+    def test_summary_line_is_logged_outside_debug_mode(self):
+        self.assertFalse(self.app.debug)
+        self.assertTrue(self.app.logger.isEnabledFor(logging.INFO))
+
+    def test_statement_shape(self):
+        self.assertEqual(
+            statement_shape("SELECT * FROM t WHERE id IN (%(id_1)s, %(id_2)s) AND name = 'x'  LIMIT 5"),
+            'SELECT * FROM t WHERE id IN (?) AND name = ? LIMIT ?')
+
+
+if __name__ == "__main__":
+    unittest.main()
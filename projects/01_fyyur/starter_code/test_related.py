@@ -0,0 +1,62 @@
+import unittest
+
+import related
+
+
+class RelatedTestCase(unittest.TestCase):
+    """
+      Checks the MinHash/LSH neighbour computation without a database.
+    """
+
+    def test_top_neighbours_ranks_by_jaccard_per_kind(self):
+        tokens = related.features(['Jazz', 'Blues'], 'San Francisco', 'CA')
+        candidates = {
+            ('venue', 1): tokens,
+            ('venue', 2): related.features(['Jazz', 'Blues'], 'San Francisco', 'CA'),
+            ('venue', 3): related.features(['Jazz'], 'San Francisco', 'CA'),
+            ('venue', 4): related.features(['Folk'], 'Oakland', 'CA'),
+            ('venue', 5): related.features(['Folk'], 'Austin', 'TX'),
+            ('artist', 7): related.features(['Blues'], 'New York', 'NY'),
+        }
+
+        neighbours = related.top_neighbours(('venue', 1), tokens, candidates, 2)
+
+        self.assertEqual([(kind, entity_id) for kind, entity_id, _ in neighbours],
+                         [('artist', 7), ('venue', 2), ('venue', 3)])
+        self.assertEqual(neighbours[1][2], 1.0)
+
+    def test_top_neighbours_breaks_ties_by_lowest_id(self):
+        tokens = related.features(['Jazz'], 'Austin', 'TX')
+        candidates = dict((('artist', i), tokens) for i in (9, 3, 5))
+
+        neighbours = related.top_neighbours(('venue', 1), tokens, candidates, 2)
+
+        self.assertEqual([entity_id for _, entity_id, _ in neighbours], [3, 5])
+
+    def test_build_finds_similar_entities(self):
+        entities = {
+            ('venue', 1): related.features(['Jazz', 'Blues'], 'San Francisco', 'CA'),
+            ('artist', 2): related.features(['Jazz', 'Blues'], 'San Francisco', 'CA'),
+            ('artist', 3): related.features(['Metal'], 'Austin', 'TX'),
+        }
+
+        bucket_rows, related_rows = related.build(entities, 5, 100)
+
+        self.assertEqual(len(bucket_rows), len(entities) * related.BANDS)
+        self.assertIn(('venue', 1, 'artist', 2, 1.0), related_rows)
+        self.assertIn(('artist', 2, 'venue', 1, 1.0), related_rows)
+        self.assertFalse([row for row in related_rows if 3 in (row[1], row[3])])
+
+    def test_build_gives_every_member_of_a_capped_bucket_neighbours(self):
+        tokens = related.features(['Jazz'], 'San Francisco', 'CA')
+        entities = dict((('venue', i), tokens) for i in range(1, 151))
+
+        _, related_rows = related.build(entities, 5, 100)
+
+        self.assertEqual(set(row[1] for row in related_rows), set(range(1, 151)))
+        self.assertEqual(
+            [row[3] for row in related_rows if row[1] == 150], [1, 2, 3, 4, 5])
+
+
+if __name__ == "__main__":
+    unittest.main()
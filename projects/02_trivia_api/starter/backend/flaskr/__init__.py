@@ -5,6 +5,7 @@ from flask_cors import CORS
 import random
 
 from models import setup_db, Question, Category
+from profiler import SQLProfiler
 
 QUESTIONS_PER_PAGE = 10
 
@@ -13,6 +14,7 @@ def create_app(test_config=None):
     # create and configure the app
     app = Flask(__name__)
     setup_db(app)
+    SQLProfiler(app)
 
     '''
   @TODO: Set up CORS. Allow '*' for origins.
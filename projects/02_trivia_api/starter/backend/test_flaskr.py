@@ -1,10 +1,14 @@
 import os
+import logging
 import unittest
 import json
+from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import create_engine, exc, text
 
 from flaskr import create_app
 from models import setup_db, Question, Category
+from profiler import SQLProfiler
 
 
 class TriviaTestCase(unittest.TestCase):
@@ -251,6 +255,48 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['success'], False)
 
 
+class ProfilerTestCase(unittest.TestCase):
+    """Tests the SQL profiler on a bare app and an in-memory SQLite engine"""
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['SQL_PROFILER_ENABLED'] = True
+        SQLProfiler(self.app)
+        self.engine = create_engine('sqlite://')
+        self.leftover = None
+
+        @self.app.route('/fail')
+        def fail():
+            with self.engine.connect() as connection:
+                try:
+                    connection.execute(text('SELECT * FROM missing'))
+                except exc.OperationalError:
+                    pass
+
+                self.leftover = list(connection.info.get('sql_profile_started', []))
+                connection.execute(text('SELECT 1'))
+
+            return ''
+
+    def test_failed_statement_is_timed_and_cleared(self):
+        """
+            Test that a failed statement leaves no start time on its connection
+        """
+
+        res = self.app.test_client().get('/fail')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(self.leftover, [])
+        self.assertIn('desc="2 queries"', res.headers['Server-Timing'])
+
+    def test_summary_line_is_logged_outside_debug_mode(self):
+        """
+            Test that the per-request summary is not filtered out
+        """
+
+        self.assertFalse(self.app.debug)
+        self.assertTrue(self.app.logger.isEnabledFor(logging.INFO))
+
 
 # Make the tests conveniently executable
 if __name__ == "__main__":